@@ -5,6 +5,7 @@ from typing import Any, AsyncGenerator
 
 from fastapi import FastAPI
 from fastapi_problem.handler import add_exception_handler
+from infini_gram_processor import get_index_warmup
 from infini_gram_processor.infini_gram_engine_exception import InfiniGramEngineException
 from opentelemetry import trace
 from opentelemetry.exporter.cloud_trace import CloudTraceSpanExporter
@@ -18,6 +19,7 @@ from src.attribution.attribution_queue_service import (
     connect_to_attribution_queue,
     disconnect_from_attribution_queue,
 )
+from src.cache.cache_router import cache_router
 from src.cache.redis import create_connection_pool
 from src.config import get_config
 from src.health import health_router
@@ -38,6 +40,7 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, Any]:
     create_connection_pool(config.cache_url)
     # Things before yield on on startup
     await connect_to_attribution_queue()
+    get_index_warmup().start()
     yield
     # Things after yield run on shutdown
     await disconnect_from_attribution_queue()
@@ -52,6 +55,7 @@ add_exception_handler(
 app.include_router(health_router)
 app.include_router(router=infinigram_router)
 app.include_router(router=attribution_router)
+app.include_router(router=cache_router)
 
 tracer_provider = TracerProvider()
 
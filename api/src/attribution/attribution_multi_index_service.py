@@ -0,0 +1,101 @@
+import asyncio
+import logging
+from typing import List, Optional
+
+from infini_gram_processor import indexes
+from infini_gram_processor.index_mappings import AvailableInfiniGramIndexId
+from opentelemetry import trace
+from redis.asyncio import Redis
+
+from src.attribution.attribution_queue_service import get_queue
+from src.attribution.attribution_request import (
+    AttributionRequest,
+    MultiIndexAttributionRequest,
+)
+from src.attribution.attribution_service import (
+    AttributionResponse,
+    AttributionService,
+    AttributionTimeoutError,
+)
+from src.cache import CacheDependency, LocalCacheDependency
+from src.cache.local_cache import LocalCache
+from src.camel_case_model import CamelCaseModel
+from src.config import get_config
+from src.documents.documents_service import DocumentsService
+
+tracer = trace.get_tracer(get_config().application_name)
+logger = logging.getLogger("uvicorn.error")
+
+
+class IndexAttributionResult(CamelCaseModel):
+    index: str
+    response: Optional[AttributionResponse] = None
+    error: Optional[str] = None
+
+
+class MultiIndexAttributionResponse(CamelCaseModel):
+    # In the order the indexes were requested
+    results: List[IndexAttributionResult]
+
+
+class MultiIndexAttributionService:
+    cache: Redis
+    local_cache: LocalCache
+
+    def __init__(
+        self,
+        cache: CacheDependency,
+        local_cache: LocalCacheDependency,
+    ):
+        self.cache = cache
+        self.local_cache = local_cache
+
+    async def _get_attribution_service(
+        self, index: AvailableInfiniGramIndexId
+    ) -> AttributionService:
+        # Builds the service the /{index}/attribution dependencies would, the first request for an index loads it so keep that off the event loop
+        infini_gram_processor = await asyncio.to_thread(indexes.__getitem__, index)
+
+        return AttributionService(
+            infini_gram_processor,
+            DocumentsService(infini_gram_processor),
+            get_queue(index),
+            self.cache,
+            self.local_cache,
+        )
+
+    async def _get_index_result(
+        self, index: AvailableInfiniGramIndexId, request: AttributionRequest
+    ) -> IndexAttributionResult:
+        try:
+            attribution_service = await self._get_attribution_service(index)
+            response = await attribution_service.get_attribution_for_response(
+                index.value, request
+            )
+        except AttributionTimeoutError as ex:
+            return IndexAttributionResult(index=index.value, error=ex.detail)
+        except Exception:
+            logger.error(
+                "Multi-index attribution failed", extra={"index": index}, exc_info=True
+            )
+            return IndexAttributionResult(index=index.value, error="Attribution failed")
+
+        return IndexAttributionResult(index=index.value, response=response)
+
+    @tracer.start_as_current_span(
+        "attribution_multi_index_service/get_attribution_for_response"
+    )
+    async def get_attribution_for_response(
+        self, request: MultiIndexAttributionRequest
+    ) -> MultiIndexAttributionResponse:
+        """Attributes the response against every requested index at once, so it takes as long as the slowest index instead of all of them. An index that fails gets an error in its result instead of failing the others."""
+        index_request = request.get_index_request()
+
+        results = await asyncio.gather(
+            *(
+                self._get_index_result(index, index_request)
+                for index in dict.fromkeys(request.indexes)
+            )
+        )
+
+        return MultiIndexAttributionResponse(results=list(results))
@@ -1,25 +1,47 @@
 from typing import Annotated
 
 from fastapi import Depends
+from infini_gram_processor.index_mappings import AvailableInfiniGramIndexId
+from redis.asyncio import Redis
 from saq import Queue
 
-from src.config import get_config
+from src.cache.redis import create_connection_pool
+from src.config import ConfigDependency, get_config
 
-queue = Queue.from_url(
-    get_config().attribution_queue_url, name=get_config().attribution_queue_name
-)
+# Each index has its own queue so workers can serve a subset of indexes and a backlog on one index doesn't hold up the others
+queues = {
+    index: Queue.from_url(
+        get_config().attribution_queue_url,
+        name=get_config().get_attribution_queue_name(index.value),
+    )
+    for index in AvailableInfiniGramIndexId
+}
 
 
 async def connect_to_attribution_queue() -> None:
-    await queue.connect()
+    for queue in queues.values():
+        await queue.connect()
 
 
 async def disconnect_from_attribution_queue() -> None:
-    await queue.disconnect()
+    for queue in queues.values():
+        await queue.disconnect()
 
 
-def get_queue() -> Queue:
-    return queue
+def get_queue(index: AvailableInfiniGramIndexId) -> Queue:
+    return queues[index]
 
 
 AttributionQueueDependency = Annotated[Queue, Depends(get_queue)]
+
+
+def get_attribution_events_redis(config: ConfigDependency) -> Redis:
+    # Workers write streamed attributions' events here, the queues can be on Postgres so this is its own Redis
+    pool = create_connection_pool(config.attribution_events_url or config.cache_url)
+
+    return Redis(connection_pool=pool)
+
+
+AttributionEventsRedisDependency = Annotated[
+    Redis, Depends(get_attribution_events_redis)
+]
@@ -1,6 +1,7 @@
 from typing import List
 
-from infini_gram_processor.models import SpanRankingMethod
+from infini_gram_processor.index_mappings import AvailableInfiniGramIndexId
+from infini_gram_processor.models import AttributionDocumentHandle, SpanRankingMethod
 from pydantic import ConfigDict, Field
 
 from src.camel_case_model import CamelCaseModel
@@ -60,3 +61,53 @@ class AttributionRequest(CamelCaseModel):
         default=40,
         description="The maximum number of tokens of the context (on each side) for the snippet in document cards",
     )
+    hydrate_documents: bool = Field(
+        default=True,
+        description="Setting this to False will return handles to each span's documents instead of the documents, which can be fetched later from the attribution documents endpoint",
+    )
+
+
+class MultiIndexAttributionRequest(AttributionRequest):
+    indexes: List[AvailableInfiniGramIndexId] = Field(
+        min_length=1,
+        examples=[["olmo-2-1124-13b", "tulu-3-405b"]],
+        description="The indexes to attribute the response against, they're attributed concurrently",
+    )
+
+    def get_index_request(self) -> AttributionRequest:
+        # Leaves out the indexes so each index's result is cached like an /{index}/attribution request's
+        return AttributionRequest.model_validate(self.model_dump(exclude={"indexes"}))
+
+
+class AttributionBatchRequest(CamelCaseModel):
+    requests: List[AttributionRequest] = Field(
+        min_length=1,
+        max_length=10_000,
+        description="The attribution requests to run against the index, results are returned in the order they finish",
+    )
+
+
+class AttributionSpanDocumentHandles(CamelCaseModel):
+    token_ids: List[int]
+    document_handles: List[AttributionDocumentHandle]
+
+
+class AttributionDocumentsRequest(CamelCaseModel):
+    spans: List[AttributionSpanDocumentHandles] = Field(
+        description="The token IDs and document handles of the spans from an attribution response"
+    )
+    maximum_context_length: int = Field(
+        gt=0,
+        default=250,
+        description="The maximum number of tokens of the context (on each side) to retrieve from the document",
+    )
+    maximum_context_length_long: int = Field(
+        gt=0,
+        default=100,
+        description="The maximum number of tokens of the context (on each side) for the document modal",
+    )
+    maximum_context_length_snippet: int = Field(
+        gt=0,
+        default=40,
+        description="The maximum number of tokens of the context (on each side) for the snippet in document cards",
+    )
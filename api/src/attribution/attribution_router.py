@@ -1,22 +1,36 @@
 from typing import Annotated
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Response
+from fastapi.responses import StreamingResponse
 from fastapi_problem.handler import generate_swagger_response
 
-from src.attribution.attribution_request import AttributionRequest
+from src.attribution.attribution_models_v2 import V2AttributionResponse
+from src.attribution.attribution_multi_index_service import (
+    MultiIndexAttributionResponse,
+    MultiIndexAttributionService,
+)
+from src.attribution.attribution_queue_service import AttributionEventsRedisDependency
+from src.attribution.attribution_request import (
+    AttributionBatchRequest,
+    AttributionDocumentsRequest,
+    AttributionRequest,
+    MultiIndexAttributionRequest,
+)
 from src.attribution.attribution_service import (
+    AttributionDocumentsResponse,
     AttributionResponse,
     AttributionService,
     AttributionTimeoutError,
 )
 from src.attribution.attribution_service_v2 import AttributionServiceV2
-from src.attribution.attribution_models_v2 import V2AttributionResponse
+from src.config import ConfigDependency
 
 attribution_router = APIRouter()
 
 
 @attribution_router.post(
     path="/{index}/attribution",
+    response_model=AttributionResponse,
     responses={
         AttributionTimeoutError.status: generate_swagger_response(
             AttributionTimeoutError  # type: ignore
@@ -27,14 +41,81 @@ async def get_document_attributions(
     index: str,
     body: AttributionRequest,
     attribution_service: Annotated[AttributionService, Depends()],
-) -> AttributionResponse:
-    result = await attribution_service.get_attribution_for_response(index, body)
+    config: ConfigDependency,
+) -> Response:
+    return Response(
+        content=await attribution_service.get_attribution_json_for_response(
+            index, body, passthrough=config.attribution_response_passthrough
+        ),
+        media_type="application/json",
+    )
+
+
+@attribution_router.post(path="/attribution")
+async def get_multi_index_document_attributions(
+    body: MultiIndexAttributionRequest,
+    multi_index_attribution_service: Annotated[MultiIndexAttributionService, Depends()],
+) -> MultiIndexAttributionResponse:
+    return await multi_index_attribution_service.get_attribution_for_response(body)
+
 
-    return result
+@attribution_router.post(
+    path="/{index}/attribution/stream",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "content": {"application/x-ndjson": {}},
+            "description": "One JSON event per line: a spans event as soon as the spans are found, a documents event for each span once its documents are fetched, then a done or error event",
+        }
+    },
+)
+async def stream_document_attributions(
+    index: str,
+    body: AttributionRequest,
+    attribution_service: Annotated[AttributionService, Depends()],
+    attribution_events_redis: AttributionEventsRedisDependency,
+) -> StreamingResponse:
+    return StreamingResponse(
+        attribution_service.stream_attribution_for_response(
+            index, body, attribution_events_redis
+        ),
+        media_type="application/x-ndjson",
+    )
+
+
+@attribution_router.post(
+    path="/{index}/attribution/batch",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "content": {"application/x-ndjson": {}},
+            "description": "One JSON result per line in the order they finish, each with the position of its request in the batch and either a response or an error",
+        }
+    },
+)
+async def get_batch_document_attributions(
+    index: str,
+    body: AttributionBatchRequest,
+    attribution_service: Annotated[AttributionService, Depends()],
+) -> StreamingResponse:
+    return StreamingResponse(
+        attribution_service.get_attribution_batch_for_response(index, body),
+        media_type="application/x-ndjson",
+    )
+
+
+@attribution_router.post(path="/{index}/attribution/documents")
+def get_attribution_documents(
+    index: str,
+    body: AttributionDocumentsRequest,
+    attribution_service: Annotated[AttributionService, Depends()],
+) -> AttributionDocumentsResponse:
+    return attribution_service.get_attribution_documents(body)
 
 
 @attribution_router.post(
     path="/{index}/attribution/v2",
+    response_model=V2AttributionResponse,
     responses={
         AttributionTimeoutError.status: generate_swagger_response(
             AttributionTimeoutError  # type: ignore
@@ -45,7 +126,10 @@ async def get_document_attributions_v2(
     index: str,
     body: AttributionRequest,
     attribution_service_v2: Annotated[AttributionServiceV2, Depends()],
-) -> V2AttributionResponse:
-    result = await attribution_service_v2.get_attribution_for_response_v2(index, body)
-
-    return result
+) -> Response:
+    return Response(
+        content=await attribution_service_v2.get_attribution_for_response_v2(
+            index, body
+        ),
+        media_type="application/json",
+    )
@@ -1,11 +1,26 @@
+import asyncio
 import logging
 from hashlib import sha256
-from typing import Any, List, Optional, Sequence
-from uuid import uuid4
+from typing import Any, AsyncIterator, List, Optional, Sequence
 
+from infini_gram_processor.attribution_documents import get_attribution_document
+from infini_gram_processor.attribution_stream import (
+    attribution_stream_event_adapter,
+    get_attribution_response_from_events,
+    get_attribution_stream_events,
+)
 from infini_gram_processor.models import (
+    AttributionDocumentHandle,
+    AttributionDocumentsEvent,
+    AttributionDoneEvent,
+    AttributionErrorEvent,
+    AttributionSpansEvent,
     BaseInfiniGramResponse,
     Document,
+    GetDocumentByPointerRequest,
+)
+from infini_gram_processor.models import (
+    AttributionResponse as WorkerAttributionResponse,
 )
 from infini_gram_processor.processor import (
     InfiniGramProcessor,
@@ -17,11 +32,21 @@ from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapProp
 from pydantic import Field, ValidationError
 from redis.asyncio import Redis
 from rfc9457 import StatusProblem
-from saq import Queue
+from saq import Job, Queue
+from saq import Status as JobStatus
+from saq.job import TERMINAL_STATUSES, UNSUCCESSFUL_TERMINAL_STATUSES
+from saq.queue.base import JobError
 
 from src.attribution.attribution_queue_service import AttributionQueueDependency
-from src.attribution.attribution_request import AttributionRequest
-from src.cache import CacheDependency
+from src.attribution.attribution_request import (
+    AttributionBatchRequest,
+    AttributionDocumentsRequest,
+    AttributionRequest,
+)
+from src.cache import CacheDependency, LocalCacheDependency
+from src.cache.cache_codec import decode_cache_value, encode_cache_value
+from src.cache.local_cache import LocalCache
+from src.cache.redis import redis_cache_stats
 from src.camel_case_model import CamelCaseModel
 from src.config import get_config
 from src.documents.documents_router import DocumentsServiceDependency
@@ -35,6 +60,13 @@ logger = logging.getLogger("uvicorn.error")
 
 _TASK_NAME_KEY = "saq.task_name"
 _TASK_TAG_KEY = "saq.action"
+_CACHE_KEY_VERSION = 2
+_JOB_TIMEOUT_SECONDS = 60
+# Since someone asked for a cached response again, we should keep it around longer
+_REFRESHED_CACHE_TTL_SECONDS = 43_200
+_TIMEOUT_DETAIL = "The server wasn't able to process your request in time. It is likely overloaded. Please try again later."
+# The event loop only keeps weak references to tasks, so tasks nothing awaits are kept here until they finish
+_background_tasks: set[asyncio.Task[None]] = set()
 
 
 class AttributionDocument(Document):
@@ -55,6 +87,8 @@ class AttributionSpan(CamelCaseModel):
     text: str
     token_ids: Sequence[int]
     documents: List[AttributionDocument]
+    # Only set when the request didn't hydrate the documents
+    document_handles: List[AttributionDocumentHandle] = []
 
 
 class AttributionResponse(BaseInfiniGramResponse):
@@ -64,6 +98,17 @@ class AttributionResponse(BaseInfiniGramResponse):
     )
 
 
+class AttributionBatchResult(CamelCaseModel):
+    # The request's position in the batch, results are sent in the order they finish
+    position: int
+    response: Optional[AttributionResponse] = None
+    error: Optional[str] = None
+
+
+class AttributionDocumentsResponse(BaseInfiniGramResponse):
+    documents_by_span: List[List[AttributionDocument]]
+
+
 class AttributionTimeoutError(StatusProblem):
     type_ = "server-overloaded"
     title = "Server overloaded"
@@ -75,6 +120,7 @@ class AttributionService:
     documents_service: DocumentsService
     attribution_queue: Queue
     cache: Redis
+    local_cache: LocalCache
 
     def __init__(
         self,
@@ -82,37 +128,61 @@ class AttributionService:
         documents_service: DocumentsServiceDependency,
         attribution_queue: AttributionQueueDependency,
         cache: CacheDependency,
+        local_cache: LocalCacheDependency,
     ):
         self.infini_gram_processor = infini_gram_processor
         self.documents_service = documents_service
         self.attribution_queue = attribution_queue
         self.cache = cache
+        self.local_cache = local_cache
 
     def _get_cache_key(self, index: str, request: AttributionRequest) -> bytes:
-        combined_index_and_request = (
-            f"{request.__class__.__qualname__}::{index}{request.model_dump_json()}"
-        )
+        # Bump the version when the cached JSON changes shape, responses are sent from the cache as-is
+        combined_index_and_request = f"{_CACHE_KEY_VERSION}::{request.__class__.__qualname__}::{index}{request.model_dump_json()}"
         key = sha256(
             combined_index_and_request.encode("utf-8", errors="ignore")
         ).digest()
 
         return key
 
-    @tracer.start_as_current_span("attribution_service/_get_cached_response")
-    async def _get_cached_response(
-        self, index: str, request: AttributionRequest
-    ) -> AttributionResponse | None:
-        key = self._get_cache_key(index, request)
+    async def _refresh_cache_ttl(self, key: bytes) -> None:
+        try:
+            await self.cache.expire(key, _REFRESHED_CACHE_TTL_SECONDS)
+        except Exception:
+            logger.warning(
+                "Failed to refresh cached response's TTL",
+                exc_info=True,
+            )
+
+    def _refresh_cache_ttl_in_background(self, key: bytes) -> None:
+        # Local hits skip getex, so Redis's TTL is pushed back without waiting on it
+        refresh_task = asyncio.create_task(self._refresh_cache_ttl(key))
+        _background_tasks.add(refresh_task)
+        refresh_task.add_done_callback(_background_tasks.discard)
+
+    def _get_locally_cached_body(self, key: bytes) -> bytes | None:
+        locally_cached_body = self.local_cache.get(key)
+        if locally_cached_body is None:
+            return None
+
+        current_span = trace.get_current_span()
+        current_span.add_event("retrieved-locally-cached-attribution-response")
+
+        self._refresh_cache_ttl_in_background(key)
+
+        return locally_cached_body
 
+    @tracer.start_as_current_span("attribution_service/_get_redis_cached_json")
+    async def _get_redis_cached_json(self, key: bytes) -> bytes | None:
         try:
-            # Since someone asked for this again, we should keep it around longer
             # This sets it to expire after 12 hours
-            cached_json = await self.cache.getex(key, ex=43_200)
+            cached_value = await self.cache.getex(key, ex=_REFRESHED_CACHE_TTL_SECONDS)
 
-            if cached_json is None:
+            if cached_value is None:
+                redis_cache_stats.misses += 1
                 return None
 
-            cached_response = AttributionResponse.model_validate_json(cached_json)
+            redis_cache_stats.hits += 1
 
             current_span = trace.get_current_span()
             current_span.add_event("retrieved-cached-attribution-response")
@@ -120,14 +190,8 @@ class AttributionService:
                 "Retrieved cached attribution response",
             )
 
-            return cached_response
+            return decode_cache_value(cached_value)
 
-        except ValidationError:
-            logger.error(
-                "Failed to parse cached response",
-                extra={"key": key.decode("utf-8")},
-                exc_info=True,
-            )
         except Exception:
             logger.error(
                 "Failed to retrieve cached response",
@@ -136,6 +200,13 @@ class AttributionService:
 
         return None
 
+    async def _get_cached_json(self, key: bytes) -> bytes | None:
+        locally_cached_body = self._get_locally_cached_body(key)
+        if locally_cached_body is not None:
+            return locally_cached_body
+
+        return await self._get_redis_cached_json(key)
+
     @tracer.start_as_current_span("attribution_service/_cache_response")
     async def _cache_response(
         self, index: str, request: AttributionRequest, json_response: str
@@ -144,7 +215,7 @@ class AttributionService:
 
         try:
             # save the response and expire it after an hour
-            await self.cache.set(key, json_response, ex=3_600)
+            await self.cache.set(key, encode_cache_value(json_response), ex=3_600)
 
             current_span = trace.get_current_span()
             current_span.add_event("cached-attribution-response")
@@ -158,15 +229,129 @@ class AttributionService:
             )
             pass
 
-    @tracer.start_as_current_span("attribution_service/get_attribution_for_response")
-    async def get_attribution_for_response(
+    @tracer.start_as_current_span("attribution_service/_load_response")
+    async def _load_response(
         self, index: str, request: AttributionRequest
-    ) -> AttributionResponse:
-        cached_response = await self._get_cached_response(index, request)
-        if cached_response is not None:
-            return cached_response
+    ) -> tuple[AttributionResponse, bytes]:
+        """
+        Reads the response from Redis or runs its job, and validates it.
+
+        The response's body as the API serializes it is kept in the local tier, so local hits can be sent without being validated again.
+        """
+        key = self._get_cache_key(index, request)
+
+        response: AttributionResponse | None = None
+        cached_json = await self._get_redis_cached_json(key)
+        if cached_json is not None:
+            try:
+                response = AttributionResponse.model_validate_json(cached_json)
+            except ValidationError:
+                logger.error(
+                    "Failed to parse cached response",
+                    extra={"key": key.hex()},
+                    exc_info=True,
+                )
+
+        if response is None:
+            attribute_result_json = await self._run_attribution_job(index, request)
+            response = AttributionResponse.model_validate_json(attribute_result_json)
+            await self._cache_response(index, request, attribute_result_json)
+
+        body = response.model_dump_json(by_alias=True).encode()
+        self.local_cache.set(key, body)
 
-        job_key = str(uuid4())
+        return response, body
+
+    def _get_job_kwargs(
+        self, index: str, request: AttributionRequest
+    ) -> dict[str, Any]:
+        otel_context: dict[str, Any] = {}
+        TraceContextTextMapPropagator().inject(otel_context)
+
+        return {
+            "index": index,
+            "input": request.response,
+            "delimiters": request.delimiters,
+            "allow_spans_with_partial_words": request.allow_spans_with_partial_words,
+            "minimum_span_length": request.minimum_span_length,
+            "maximum_frequency": request.maximum_frequency,
+            "maximum_span_density": request.maximum_span_density,
+            "span_ranking_method": request.span_ranking_method,
+            "maximum_context_length": request.maximum_context_length,
+            "maximum_context_length_long": request.maximum_context_length_long,
+            "maximum_context_length_snippet": request.maximum_context_length_snippet,
+            "maximum_documents_per_span": request.maximum_documents_per_span,
+            "hydrate_documents": request.hydrate_documents,
+            "otel_context": otel_context,
+        }
+
+    async def _abort_job(self, job_key: str) -> None:
+        job_to_abort = await self.attribution_queue.job(job_key)
+        # Aborting a finished job would leave it aborting with no worker to finish the abort
+        if job_to_abort is not None and job_to_abort.status not in TERMINAL_STATUSES:
+            await self.attribution_queue.abort(job_to_abort, "Client timeout")
+
+    async def _get_completed_job(self, job_key: str) -> Job | None:
+        """Returns the job kept under the key if it completed, so an identical request reuses its result instead of running it again."""
+        kept_job = await self.attribution_queue.job(job_key)
+        if kept_job is None:
+            return None
+
+        if kept_job.status == JobStatus.COMPLETE:
+            return kept_job
+
+        # A job that finished while it was being aborted is never picked up again, saq won't replace it until it expires
+        if kept_job.status == JobStatus.ABORTING and kept_job.completed:
+            await self.attribution_queue.finish(
+                kept_job, JobStatus.ABORTED, error=kept_job.error
+            )
+
+        return None
+
+    async def _enqueue_job(
+        self, function: str, job_key: str, job_kwargs: dict[str, Any]
+    ) -> None:
+        # saq replaces a finished job kept under the same key and won't enqueue one that's still queued or running, so identical requests wait on the same job
+        await self.attribution_queue.enqueue(
+            function, timeout=_JOB_TIMEOUT_SECONDS, key=job_key, **job_kwargs
+        )
+
+    async def _apply_job(
+        self, function: str, job_key: str, job_kwargs: dict[str, Any]
+    ) -> Any:
+        def is_finished(_job_key: str, status: JobStatus) -> bool:
+            return status in TERMINAL_STATUSES
+
+        async with asyncio.timeout(_JOB_TIMEOUT_SECONDS):
+            completed_job = await self._get_completed_job(job_key)
+            if completed_job is not None:
+                return completed_job.result
+
+            # Listen before enqueueing, like saq's apply, so the job can't finish unnoticed
+            listen_task = asyncio.create_task(
+                self.attribution_queue.listen([job_key], is_finished, timeout=None)
+            )
+            try:
+                await self._enqueue_job(function, job_key, job_kwargs)
+                await listen_task
+            finally:
+                listen_task.cancel()
+
+            finished_job = await self.attribution_queue.job(job_key)
+
+        if finished_job is None:
+            raise RuntimeError(f"Attribution job {job_key} expired before it was read")
+
+        if finished_job.status in UNSUCCESSFUL_TERMINAL_STATUSES:
+            raise JobError(finished_job)
+
+        return finished_job.result
+
+    async def _run_attribution_job(
+        self, index: str, request: AttributionRequest
+    ) -> str:
+        # Identical requests get the same job key so concurrent requests from every replica wait on the same job
+        job_key = self._get_cache_key(index, request).hex()
 
         try:
             logger.debug("Adding attribution request to queue", extra={"index": index})
@@ -181,34 +366,26 @@ class AttributionService:
                     SpanAttributes.MESSAGING_SYSTEM: "saq",
                 },
             ):
-                otel_context: dict[str, Any] = {}
-                TraceContextTextMapPropagator().inject(otel_context)
-                attribute_result_json = await self.attribution_queue.apply(
-                    "attribute",
-                    timeout=60,
-                    key=job_key,
-                    index=index,
-                    input=request.response,
-                    delimiters=request.delimiters,
-                    allow_spans_with_partial_words=request.allow_spans_with_partial_words,
-                    minimum_span_length=request.minimum_span_length,
-                    maximum_frequency=request.maximum_frequency,
-                    maximum_span_density=request.maximum_span_density,
-                    span_ranking_method=request.span_ranking_method,
-                    maximum_context_length=request.maximum_context_length,
-                    maximum_context_length_long=request.maximum_context_length_long,
-                    maximum_context_length_snippet=request.maximum_context_length_snippet,
-                    maximum_documents_per_span=request.maximum_documents_per_span,
-                    otel_context=otel_context,
+                attribute_result_json: str = await self._apply_job(
+                    "attribute", job_key, self._get_job_kwargs(index, request)
                 )
 
-            attribute_result = AttributionResponse.model_validate_json(
-                attribute_result_json
+            return attribute_result_json
+        except JobError as ex:
+            # Another request waiting on the same job timed out and aborted it
+            if ex.job.status != JobStatus.ABORTED:
+                raise
+
+            logger.error(
+                "Attribution job was aborted",
+                extra={"job_key": job_key, "index": index},
             )
 
-            await self._cache_response(index, request, attribute_result_json)
+            current_span = trace.get_current_span()
+            current_span.set_status(Status(StatusCode.ERROR))
+            current_span.record_exception(ex)
 
-            return attribute_result
+            raise AttributionTimeoutError(_TIMEOUT_DETAIL)
         except TimeoutError as ex:
             logger.error(
                 "Attribution request timed out",
@@ -219,10 +396,262 @@ class AttributionService:
             current_span.set_status(Status(StatusCode.ERROR))
             current_span.record_exception(ex)
 
-            job_to_abort = await self.attribution_queue.job(job_key)
-            if job_to_abort is not None:
-                await self.attribution_queue.abort(job_to_abort, "Client timeout")
+            await self._abort_job(job_key)
+
+            raise AttributionTimeoutError(_TIMEOUT_DETAIL)
+
+    @tracer.start_as_current_span("attribution_service/get_attribution_for_response")
+    async def get_attribution_for_response(
+        self, index: str, request: AttributionRequest
+    ) -> AttributionResponse:
+        locally_cached_body = self._get_locally_cached_body(
+            self._get_cache_key(index, request)
+        )
+        if locally_cached_body is not None:
+            return AttributionResponse.model_validate_json(locally_cached_body)
 
-            raise AttributionTimeoutError(
-                "The server wasn't able to process your request in time. It is likely overloaded. Please try again later."
+        response, _ = await self._load_response(index, request)
+
+        return response
+
+    @tracer.start_as_current_span(
+        "attribution_service/get_attribution_json_for_response"
+    )
+    async def get_attribution_json_for_response(
+        self, index: str, request: AttributionRequest, passthrough: bool
+    ) -> bytes:
+        """
+        Returns the response's body, ready to send to clients. Bodies from the local tier are sent as-is without being validated again.
+
+        With `passthrough`, the JSON the worker wrote is sent without being validated at all. The worker serializes responses the same way the API does, so it's the same body.
+        """
+        key = self._get_cache_key(index, request)
+
+        locally_cached_body = self._get_locally_cached_body(key)
+        if locally_cached_body is not None:
+            return locally_cached_body
+
+        if not passthrough:
+            _, body = await self._load_response(index, request)
+            return body
+
+        attribute_result_json = await self._get_redis_cached_json(key)
+        if attribute_result_json is None:
+            job_result_json = await self._run_attribution_job(index, request)
+            await self._cache_response(index, request, job_result_json)
+            attribute_result_json = job_result_json.encode()
+
+        self.local_cache.set(key, attribute_result_json)
+
+        return attribute_result_json
+
+    @tracer.start_as_current_span(
+        "attribution_service/get_attribution_batch_for_response"
+    )
+    async def get_attribution_batch_for_response(
+        self, index: str, request: AttributionBatchRequest
+    ) -> AsyncIterator[bytes]:
+        """Yields a line of JSON for each of the batch's requests as soon as it's attributed, each with its position in the batch so callers can match them back up."""
+        # Each request is cached and enqueued like a lone request, enqueueing a few at a time lets workers attribute them in batches without one call filling the queue
+        semaphore = asyncio.Semaphore(get_config().attribution_batch_concurrency)
+
+        async def attribute(
+            position: int, item_request: AttributionRequest
+        ) -> AttributionBatchResult:
+            async with semaphore:
+                try:
+                    response = await self.get_attribution_for_response(
+                        index, item_request
+                    )
+                except AttributionTimeoutError as ex:
+                    return AttributionBatchResult(position=position, error=ex.detail)
+                except Exception:
+                    logger.error(
+                        "Batched attribution failed",
+                        extra={"index": index, "position": position},
+                        exc_info=True,
+                    )
+                    return AttributionBatchResult(
+                        position=position, error="Attribution failed"
+                    )
+
+            return AttributionBatchResult(position=position, response=response)
+
+        tasks = [
+            asyncio.create_task(attribute(position, item_request))
+            for position, item_request in enumerate(request.requests)
+        ]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                result = await next_result
+                yield result.model_dump_json(by_alias=True).encode() + b"\n"
+        finally:
+            # Stops the rest of the batch if the client goes away
+            for task in tasks:
+                task.cancel()
+
+    @tracer.start_as_current_span("attribution_service/stream_attribution_for_response")
+    async def stream_attribution_for_response(
+        self,
+        index: str,
+        request: AttributionRequest,
+        attribution_events_redis: Redis,
+    ) -> AsyncIterator[bytes]:
+        """
+        Yields a streamed attribution's events as lines of JSON: the spans as soon as the worker finds them, then each span's documents as they're fetched, then a done or error event.
+
+        Cached responses are sent as the same events all at once.
+        """
+        cached_json = await self._get_cached_json(self._get_cache_key(index, request))
+
+        if cached_json is not None:
+            cached_response = WorkerAttributionResponse.model_validate_json(cached_json)
+            for event in get_attribution_stream_events(cached_response):
+                yield event.model_dump_json(by_alias=True).encode() + b"\n"
+
+            return
+
+        try:
+            async for event_json in self._stream_attribution_job(
+                index, request, attribution_events_redis
+            ):
+                yield event_json + b"\n"
+        except Exception as ex:
+            logger.error(
+                "Streamed attribution failed", extra={"index": index}, exc_info=True
+            )
+
+            current_span = trace.get_current_span()
+            current_span.set_status(Status(StatusCode.ERROR))
+            current_span.record_exception(ex)
+
+            # The response has already started, so errors are sent as an event instead of a status
+            yield (
+                AttributionErrorEvent(detail="Attribution failed")
+                .model_dump_json(by_alias=True)
+                .encode()
+                + b"\n"
             )
+
+    async def _stream_attribution_job(
+        self, index: str, request: AttributionRequest, attribution_events_redis: Redis
+    ) -> AsyncIterator[bytes]:
+        # Streamed jobs publish events that plain jobs don't, so they need their own key. Identical streamed requests still share a job and each read its events from the start
+        job_key = f"{self._get_cache_key(index, request).hex()}-stream"
+        events_key = get_config().get_attribution_events_key(job_key)
+
+        with tracer.start_as_current_span(
+            "attribution_service/publish_attribution_stream_job",
+            kind=SpanKind.PRODUCER,
+            attributes={
+                _TASK_NAME_KEY: "attribute_stream",
+                SpanAttributes.MESSAGING_MESSAGE_ID: job_key,
+                _TASK_TAG_KEY: "apply_async",
+                SpanAttributes.MESSAGING_SYSTEM: "saq",
+            },
+        ):
+            completed_job = await self._get_completed_job(job_key)
+            if completed_job is None:
+                await self._enqueue_job(
+                    "attribute_stream", job_key, self._get_job_kwargs(index, request)
+                )
+
+        if completed_job is not None:
+            # An identical streamed request just finished and its events may have expired, so its result is sent as events instead
+            completed_response = WorkerAttributionResponse.model_validate_json(
+                completed_job.result
+            )
+            for event in get_attribution_stream_events(completed_response):
+                yield event.model_dump_json(by_alias=True).encode()
+
+            await self._cache_response(index, request, completed_job.result)
+            return
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + _JOB_TIMEOUT_SECONDS
+        last_event_id: bytes | str = "0-0"
+        spans_event: AttributionSpansEvent | None = None
+        documents_events: list[AttributionDocumentsEvent] = []
+
+        while True:
+            remaining_seconds = deadline - loop.time()
+            if remaining_seconds <= 0:
+                logger.error(
+                    "Streamed attribution request timed out",
+                    extra={"job_key": job_key, "index": index},
+                )
+                await self._abort_job(job_key)
+
+                yield (
+                    AttributionErrorEvent(detail=_TIMEOUT_DETAIL)
+                    .model_dump_json(by_alias=True)
+                    .encode()
+                )
+                return
+
+            stream_entries = await attribution_events_redis.xread(
+                {events_key: last_event_id},
+                block=max(1, int(remaining_seconds * 1000)),
+            )
+            for _, entries in stream_entries:
+                for event_id, fields in entries:
+                    last_event_id = event_id
+                    event_json: bytes = fields[b"event"]
+                    yield event_json
+
+                    event = attribution_stream_event_adapter.validate_json(event_json)
+                    if isinstance(event, AttributionSpansEvent):
+                        spans_event = event
+                    elif isinstance(event, AttributionDocumentsEvent):
+                        documents_events.append(event)
+                    elif isinstance(event, AttributionDoneEvent):
+                        if spans_event is not None:
+                            await self._cache_response(
+                                index,
+                                request,
+                                get_attribution_response_from_events(
+                                    spans_event, documents_events
+                                ).model_dump_json(by_alias=True),
+                            )
+                        return
+                    else:
+                        return
+
+    @tracer.start_as_current_span("attribution_service/get_attribution_documents")
+    def get_attribution_documents(
+        self, request: AttributionDocumentsRequest
+    ) -> AttributionDocumentsResponse:
+        """Fetches the documents for the handles of an attribution that wasn't hydrated, the same documents it would've had if it was."""
+        documents_by_span = self.infini_gram_processor.get_documents_by_pointers(
+            GetDocumentByPointerRequest(
+                docs=[
+                    {"s": document_handle.shard, "ptr": document_handle.pointer}
+                    for document_handle in span.document_handles
+                ],
+                span_ids=span.token_ids,
+                needle_length=len(span.token_ids),
+                maximum_context_length=request.maximum_context_length,
+            )
+            for span in request.spans
+        )
+
+        return AttributionDocumentsResponse(
+            index=self.infini_gram_processor.index,
+            documents_by_span=[
+                [
+                    AttributionDocument(
+                        **vars(
+                            get_attribution_document(
+                                infini_gram_index=self.infini_gram_processor,
+                                document=document,
+                                span_length=len(span.token_ids),
+                                maximum_context_length_long=request.maximum_context_length_long,
+                                maximum_context_length_snippet=request.maximum_context_length_snippet,
+                            )
+                        )
+                    )
+                    for document in documents
+                ]
+                for span, documents in zip(request.spans, documents_by_span)
+            ],
+        )
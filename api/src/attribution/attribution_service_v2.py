@@ -1,13 +1,11 @@
 import logging
-from hashlib import sha256
-from typing import Dict, List
+from typing import Dict, List, Set
 from uuid import uuid4
 
 from opentelemetry import trace
 from opentelemetry.semconv.trace import SpanAttributes
 from opentelemetry.trace import SpanKind, Status, StatusCode
 from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
-from pydantic import ValidationError
 from redis.asyncio import Redis
 from saq import Queue
 
@@ -21,7 +19,8 @@ from src.attribution.attribution_models_v2 import (
     V2Span,
     V2NestedSpan
 )
-from src.cache import CacheDependency
+from src.cache import CacheDependency, LocalCacheDependency
+from src.cache.local_cache import LocalCache
 from src.config import get_config
 from src.documents.documents_router import DocumentsServiceDependency
 from src.documents.documents_service import DocumentsService
@@ -30,9 +29,14 @@ from src.infinigram.infini_gram_dependency import InfiniGramProcessorDependency
 tracer = trace.get_tracer(get_config().application_name)
 logger = logging.getLogger("uvicorn.error")
 
+# v2 bodies are kept in the local tier next to the v1 response they're derived from, Redis only holds the v1 response
+_V2_LOCAL_CACHE_KEY_SUFFIX = b"::v2"
+
 
 class AttributionServiceV2:
     """Service for handling v2 attribution requests with new response format"""
+
+    local_cache: LocalCache
     
     def __init__(
         self,
@@ -40,68 +44,21 @@ class AttributionServiceV2:
         documents_service: DocumentsServiceDependency,
         attribution_queue: AttributionQueueDependency,
         cache: CacheDependency,
+        local_cache: LocalCacheDependency,
     ):
         # Reuse the existing attribution service for the underlying work
         self.attribution_service = AttributionService(
-            infini_gram_processor, documents_service, attribution_queue, cache
-        )
-        self.cache = cache
-
-    def _get_cache_key_v2(self, index: str, request: AttributionRequest) -> bytes:
-        """Generate cache key for v2 responses"""
-        combined_index_and_request = (
-            f"v2::{request.__class__.__qualname__}::{index}{request.model_dump_json()}"
+            infini_gram_processor, documents_service, attribution_queue, cache, local_cache
         )
-        key = sha256(
-            combined_index_and_request.encode("utf-8", errors="ignore")
-        ).digest()
-        return key
-
-    @tracer.start_as_current_span("attribution_service_v2/_get_cached_response")
-    async def _get_cached_response_v2(
-        self, index: str, request: AttributionRequest
-    ) -> V2AttributionResponse | None:
-        """Get cached v2 response"""
-        key = self._get_cache_key_v2(index, request)
-
-        try:
-            cached_json = await self.cache.getex(key, ex=43_200)
-            if cached_json is None:
-                return None
-
-            cached_response = V2AttributionResponse.model_validate_json(cached_json)
-            current_span = trace.get_current_span()
-            current_span.add_event("retrieved-cached-attribution-response-v2")
-            logger.debug("Retrieved cached v2 attribution response")
-            return cached_response
-
-        except ValidationError:
-            logger.error("Failed to parse cached v2 response", exc_info=True)
-        except Exception:
-            logger.error("Failed to retrieve cached v2 response", exc_info=True)
-
-        return None
-
-    @tracer.start_as_current_span("attribution_service_v2/_cache_response")
-    async def _cache_response_v2(
-        self, index: str, request: AttributionRequest, json_response: str
-    ) -> None:
-        """Cache v2 response"""
-        key = self._get_cache_key_v2(index, request)
-
-        try:
-            await self.cache.set(key, json_response, ex=3_600)
-            current_span = trace.get_current_span()
-            current_span.add_event("cached-attribution-response-v2")
-            logger.debug("Saved v2 attribution response to cache")
-        except Exception:
-            logger.warning("Failed to cache v2 attribution response", exc_info=True)
+        self.local_cache = local_cache
 
     def _transform_to_v2_format(self, index: str, original_response) -> V2AttributionResponse:
         """Transform the original attribution response to v2 format"""
         
         # Create document lookup for deduplication
         documents_dict: Dict[str, V2Document] = {}
+        # Mirrors each document's corresponding_span_texts so checking for a span's text doesn't scan the list
+        span_texts_by_doc_id: Dict[str, Set[str]] = {}
         v2_spans: List[V2Span] = []
         
         # Process each span from the original response
@@ -134,10 +91,12 @@ class AttributionServiceV2:
                         usage=getattr(doc, 'usage', 'Pre-training')
                     )
                     documents_dict[doc_id] = v2_doc
+                    span_texts_by_doc_id[doc_id] = {span.text}
                 else:
                     # Update existing document with this span's information
                     existing_doc = documents_dict[doc_id]
-                    if span.text not in existing_doc.corresponding_span_texts:
+                    if span.text not in span_texts_by_doc_id[doc_id]:
+                        span_texts_by_doc_id[doc_id].add(span.text)
                         existing_doc.corresponding_span_texts.append(span.text)
                         existing_doc.corresponding_spans.append(len(v2_spans))
             
@@ -162,22 +121,29 @@ class AttributionServiceV2:
     @tracer.start_as_current_span("attribution_service_v2/get_attribution_for_response")
     async def get_attribution_for_response_v2(
         self, index: str, request: AttributionRequest
-    ) -> V2AttributionResponse:
-        """Get attribution response in v2 format"""
-        
-        # Check cache first
-        cached_response = await self._get_cached_response_v2(index, request)
-        if cached_response is not None:
-            return cached_response
+    ) -> bytes:
+        """Get the attribution response's body in v2 format, ready to send to clients"""
+
+        cache_key = self.attribution_service._get_cache_key(index, request)
+        local_cache_key = cache_key + _V2_LOCAL_CACHE_KEY_SUFFIX
+
+        # v2 hits skip parsing the v1 response and transforming it
+        locally_cached_body = self.local_cache.get(local_cache_key)
+        if locally_cached_body is not None:
+            current_span = trace.get_current_span()
+            current_span.add_event("retrieved-locally-cached-v2-attribution-response")
+            self.attribution_service._refresh_cache_ttl_in_background(cache_key)
 
-        # Get response from original attribution service
+            return locally_cached_body
+
+        # Only the v1 response goes to Redis, v2 is derived from it so each request is cached there once
         original_response = await self.attribution_service.get_attribution_for_response(index, request)
         
         # Transform to v2 format
-        v2_response = self._transform_to_v2_format(index, original_response)
-        
-        # Cache the v2 response
-        v2_json = v2_response.model_dump_json()
-        await self._cache_response_v2(index, request, v2_json)
-        
-        return v2_response
+        with tracer.start_as_current_span("attribution_service_v2/_transform_to_v2_format"):
+            v2_response = self._transform_to_v2_format(index, original_response)
+
+        v2_body = v2_response.model_dump_json(by_alias=True).encode()
+        self.local_cache.set(local_cache_key, v2_body)
+
+        return v2_body
@@ -3,6 +3,8 @@ from typing import Annotated
 from fastapi import Depends
 from redis.asyncio import Redis
 
+from src.cache.local_cache import LocalCache, get_local_cache
 from src.cache.redis import get_redis
 
 CacheDependency = Annotated[Redis, Depends(get_redis)]
+LocalCacheDependency = Annotated[LocalCache, Depends(get_local_cache)]
@@ -0,0 +1,30 @@
+import zstandard
+
+# JSON can't start with a NUL byte, so entries written before compression was added still decode as plain JSON
+_MAGIC = b"\x00igc"
+_FORMAT_VERSION = 1
+_HEADER = _MAGIC + bytes([_FORMAT_VERSION])
+_COMPRESSION_LEVEL = 3
+
+
+class UnknownCacheFormatError(Exception):
+    pass
+
+
+def encode_cache_value(json_value: str) -> bytes:
+    """Compresses a response's JSON with zstd behind a header with the format version, attribution responses repeat a lot of document text so they shrink several times over."""
+    return _HEADER + zstandard.compress(json_value.encode(), _COMPRESSION_LEVEL)
+
+
+def decode_cache_value(value: bytes) -> bytes:
+    """Returns the JSON of a value written by encode_cache_value, or the value itself if it's uncompressed JSON."""
+    if not value.startswith(_MAGIC):
+        return value
+
+    format_version = value[len(_MAGIC)]
+    if format_version != _FORMAT_VERSION:
+        raise UnknownCacheFormatError(
+            f"Cache entry has format version {format_version}, expected {_FORMAT_VERSION}"
+        )
+
+    return zstandard.decompress(value[len(_HEADER) :])
@@ -0,0 +1,40 @@
+from fastapi import APIRouter
+
+from src.cache import LocalCacheDependency
+from src.cache.redis import redis_cache_stats
+from src.camel_case_model import CamelCaseModel
+
+cache_router = APIRouter(prefix="/cache")
+
+
+class CacheTierStatsResponse(CamelCaseModel):
+    hits: int
+    misses: int
+
+
+class LocalCacheStatsResponse(CacheTierStatsResponse):
+    entries: int
+    size_bytes: int
+    maximum_bytes: int
+
+
+class CacheStatsResponse(CamelCaseModel):
+    local: LocalCacheStatsResponse
+    redis: CacheTierStatsResponse
+
+
+# Counts are per API process and reset when it restarts
+@cache_router.get("/stats")
+def get_cache_stats(local_cache: LocalCacheDependency) -> CacheStatsResponse:
+    return CacheStatsResponse(
+        local=LocalCacheStatsResponse(
+            hits=local_cache.stats.hits,
+            misses=local_cache.stats.misses,
+            entries=len(local_cache),
+            size_bytes=local_cache.size_bytes,
+            maximum_bytes=local_cache.maximum_bytes,
+        ),
+        redis=CacheTierStatsResponse(
+            hits=redis_cache_stats.hits, misses=redis_cache_stats.misses
+        ),
+    )
@@ -0,0 +1,90 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+
+from src.config import get_config
+
+
+@dataclass
+class CacheTierStats:
+    hits: int = 0
+    misses: int = 0
+
+
+@dataclass
+class _LocalCacheEntry:
+    value: bytes
+    expires_at: float
+
+
+class LocalCache:
+    """
+    An in-process LRU cache of responses' bodies that sits in front of Redis, so hits skip the network.
+
+    Only the bodies are kept so the cache's size is what it actually holds. They're only ever set to the bodies sent to clients, so callers can send hits as-is. Entries expire `ttl_seconds` after they're set.
+    """
+
+    maximum_bytes: int
+    ttl_seconds: float
+    size_bytes: int
+    stats: CacheTierStats
+
+    def __init__(self, maximum_bytes: int, ttl_seconds: float):
+        self.maximum_bytes = maximum_bytes
+        self.ttl_seconds = ttl_seconds
+        self.size_bytes = 0
+        self.stats = CacheTierStats()
+
+        self._entries: OrderedDict[bytes, _LocalCacheEntry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: bytes) -> bytes | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                entry = None
+
+            if entry is None:
+                self.stats.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return entry.value
+
+    def set(self, key: bytes, value: bytes) -> None:
+        # Entries bigger than the whole cache would only evict everything else
+        if len(value) > self.maximum_bytes:
+            return
+
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = _LocalCacheEntry(
+                value=value, expires_at=time.monotonic() + self.ttl_seconds
+            )
+            self.size_bytes += len(value)
+
+            while self.size_bytes > self.maximum_bytes:
+                _, evicted_entry = self._entries.popitem(last=False)
+                self.size_bytes -= len(evicted_entry.value)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: bytes) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size_bytes -= len(entry.value)
+
+
+@lru_cache
+def get_local_cache() -> LocalCache:
+    config = get_config()
+
+    return LocalCache(
+        maximum_bytes=config.local_cache_maximum_bytes,
+        ttl_seconds=config.local_cache_ttl_seconds,
+    )
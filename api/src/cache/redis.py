@@ -2,8 +2,12 @@ from functools import lru_cache
 
 import redis.asyncio as redis
 
+from src.cache.local_cache import CacheTierStats
 from src.config import ConfigDependency
 
+# Counts lookups of cached responses that made it past the local cache
+redis_cache_stats = CacheTierStats()
+
 
 @lru_cache
 def create_connection_pool(url: str) -> redis.ConnectionPool:
@@ -15,6 +15,15 @@ class Config(BaseSettings):
     attribution_queue_url: str = "redis://localhost:6379"
     python_env: str = "prod"
     cache_url: str = "redis://localhost:6379"
+    # Attribution responses are also cached in each API process, set LOCAL_CACHE_MAXIMUM_BYTES to 0 to turn that off
+    local_cache_maximum_bytes: int = 256 * 1024 * 1024
+    local_cache_ttl_seconds: float = 600
+    # The Redis that workers write streamed attributions' events to, unset means the cache's. Workers have to be given the same URL
+    attribution_events_url: str | None = None
+    # Sends /attribution responses as the JSON the worker wrote instead of validating and serializing them again. Only turn this on when the API and worker are deployed from the same version
+    attribution_response_passthrough: bool = False
+    # How many of a /attribution/batch request's items are waiting on the queue at once. Workers attribute the jobs that arrive together in one batch, so this should be a few times the workers' ATTRIBUTION_BATCH_SIZE
+    attribution_batch_concurrency: int = 32
 
     @computed_field  # type: ignore[prop-decorator]
     @property
@@ -23,6 +32,12 @@ class Config(BaseSettings):
 
         return f"{queue_prefix}-{self.python_env}"
 
+    def get_attribution_queue_name(self, index: str) -> str:
+        return f"{self.attribution_queue_name}-{index}"
+
+    def get_attribution_events_key(self, job_key: str) -> str:
+        return f"{self.attribution_queue_name}-events:{job_key}"
+
 
 @lru_cache
 def get_config() -> Config:
@@ -1,11 +1,60 @@
-from fastapi import APIRouter, status
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Response, status
+from infini_gram_processor import IndexWarmup, get_index_warmup
+
+from src.camel_case_model import CamelCaseModel
 
 health_router = APIRouter(prefix="/health")
 
 
+class IndexWarmupStatus(CamelCaseModel):
+    index: str
+    total_bytes: int
+    warmed_bytes: int
+    done: bool
+    error: str | None
+
+
+class ReadinessResponse(CamelCaseModel):
+    ready: bool
+    indexes: list[IndexWarmupStatus]
+
+
 # This tells the machinery that powers Skiff (Kubernetes) that your application
 # is ready to receive traffic. Returning a non 2XX response code will prevent the
 # application from receiving live requests.
 @health_router.get("/", status_code=status.HTTP_204_NO_CONTENT)
 def health() -> None:
     return
+
+
+# Unlike /health this waits for the index warmup to finish, so point readiness probes here
+# and keep /health for liveness. It's ready right away if warmup isn't enabled. An index whose
+# warmup failed stays not done with its error set, so it keeps this unready instead of
+# sending traffic to cold or missing files.
+@health_router.get(
+    "/ready",
+    responses={status.HTTP_503_SERVICE_UNAVAILABLE: {"model": ReadinessResponse}},
+)
+def ready(
+    response: Response,
+    index_warmup: Annotated[IndexWarmup, Depends(get_index_warmup)],
+) -> ReadinessResponse:
+    is_ready = index_warmup.is_ready()
+    if not is_ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+
+    return ReadinessResponse(
+        ready=is_ready,
+        indexes=[
+            IndexWarmupStatus(
+                index=progress.index,
+                total_bytes=progress.total_bytes,
+                warmed_bytes=progress.warmed_bytes,
+                done=progress.done,
+                error=progress.error,
+            )
+            for progress in index_warmup.get_progress()
+        ],
+    )
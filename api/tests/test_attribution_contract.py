@@ -0,0 +1,90 @@
+import pytest
+from infini_gram_processor.models import (
+    AttributionDocument,
+    AttributionDocumentHandle,
+    AttributionSpan,
+)
+from infini_gram_processor.models import (
+    AttributionResponse as WorkerAttributionResponse,
+)
+from src.attribution.attribution_service import AttributionResponse
+
+
+def get_hydrated_response() -> WorkerAttributionResponse:
+    return WorkerAttributionResponse(
+        index="pileval-llama",
+        input_tokens=["busy", " medieval", " streets", " é", "."],
+        spans=[
+            AttributionSpan(
+                left=0,
+                right=3,
+                length=3,
+                count=2,
+                unigram_logprob_sum=-12.625,
+                text="busy medieval streets",
+                token_ids=[13681, 16959, 14708],
+                documents=[
+                    AttributionDocument(
+                        document_index=42,
+                        document_length=512,
+                        display_length=8,
+                        needle_offset=2,
+                        metadata={
+                            "path": "pile-val.jsonl",
+                            "metadata": {"pile_set_name": "Pile-CC"},
+                        },
+                        token_ids=[1, 2, 13681, 16959, 14708, 3, 4, 5],
+                        text="Along the busy medieval streets — “quoted” ü",
+                        blocked=True,
+                        display_length_long=8,
+                        needle_offset_long=2,
+                        text_long="Along the busy medieval streets — “quoted” ü",
+                        display_offset_snippet=1,
+                        needle_offset_snippet=1,
+                        text_snippet="the busy medieval streets",
+                    )
+                ],
+            )
+        ],
+    )
+
+
+def get_handle_only_response() -> WorkerAttributionResponse:
+    return WorkerAttributionResponse(
+        index="pileval-llama",
+        input_tokens=None,
+        spans=[
+            AttributionSpan(
+                left=1,
+                right=3,
+                length=2,
+                count=1,
+                unigram_logprob_sum=-7.5,
+                text=" medieval streets",
+                token_ids=[16959, 14708],
+                documents=[],
+                document_handles=[
+                    AttributionDocumentHandle(shard=0, pointer=123_456_789),
+                    AttributionDocumentHandle(shard=1, pointer=0),
+                ],
+            )
+        ],
+    )
+
+
+# Passthrough sends the worker's JSON to clients as-is, so it has to be the body the API would've sent itself
+@pytest.mark.parametrize(
+    "worker_response",
+    [get_hydrated_response(), get_handle_only_response()],
+    ids=["hydrated", "handle-only"],
+)
+def test_worker_json_is_the_api_body(
+    worker_response: WorkerAttributionResponse,
+) -> None:
+    worker_json = worker_response.model_dump_json(by_alias=True)
+
+    api_json = AttributionResponse.model_validate_json(worker_json).model_dump_json(
+        by_alias=True
+    )
+
+    assert worker_json == api_json
@@ -0,0 +1,156 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
+from unittest.mock import MagicMock
+from uuid import uuid4
+
+import pytest
+from saq import Queue, Worker
+from saq import Status as JobStatus
+from saq.queue.base import JobError
+from saq.types import Context
+from src.attribution.attribution_request import AttributionRequest
+from src.attribution.attribution_service import AttributionService
+
+# Jobs are kept under their request's key after they finish, which only misbehaves on the Postgres queue production runs on
+_QUEUE_URL = os.environ.get("ATTRIBUTION_TEST_QUEUE_URL")
+
+pytestmark = pytest.mark.skipif(
+    _QUEUE_URL is None,
+    reason="Set ATTRIBUTION_TEST_QUEUE_URL to a Postgres URL to run the queue tests",
+)
+
+_INDEX = "pileval-llama"
+# Well under the service's own timeout, so a request stuck waiting on a job fails the test instead of timing out
+_WAIT_SECONDS = 10
+
+
+class StubAttribution:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.failures_left = 0
+
+    async def attribute(self, ctx: Context, **kwargs: Any) -> str:
+        self.calls += 1
+        await asyncio.sleep(0.2)
+
+        if self.failures_left > 0:
+            self.failures_left -= 1
+            raise RuntimeError("Attribution failed")
+
+        return f"result {self.calls}"
+
+
+@asynccontextmanager
+async def attribution_service(
+    stub: StubAttribution,
+) -> AsyncIterator[AttributionService]:
+    assert _QUEUE_URL is not None
+    queue_name = f"attribution-test-{uuid4().hex}"
+    # The worker gets its own queue like it would in its own process
+    queue = Queue.from_url(_QUEUE_URL, name=queue_name)
+    worker_queue = Queue.from_url(_QUEUE_URL, name=queue_name)
+    await queue.connect()
+    await worker_queue.connect()
+
+    worker = Worker(worker_queue, functions=[("attribute", stub.attribute)])
+    worker.SIGNALS = []
+    worker_task = asyncio.create_task(worker.start())
+
+    try:
+        yield AttributionService(
+            MagicMock(), MagicMock(), queue, MagicMock(), MagicMock()
+        )
+    finally:
+        await worker.stop()
+        await asyncio.gather(worker_task, return_exceptions=True)
+        await worker_queue.disconnect()
+        await queue.disconnect()
+
+
+def get_request() -> AttributionRequest:
+    # Job keys are unique across every queue in the table, so each test gets a request of its own
+    return AttributionRequest(response=f"busy medieval streets {uuid4().hex}")
+
+
+async def run_job(service: AttributionService, request: AttributionRequest) -> str:
+    async with asyncio.timeout(_WAIT_SECONDS):
+        return await service._run_attribution_job(_INDEX, request)
+
+
+def test_identical_requests_share_a_job() -> None:
+    async def check() -> None:
+        stub = StubAttribution()
+        request = get_request()
+        async with attribution_service(stub) as service:
+            results = await asyncio.gather(
+                run_job(service, request), run_job(service, request)
+            )
+
+        assert list(results) == ["result 1", "result 1"]
+        assert stub.calls == 1
+
+    asyncio.run(check())
+
+
+def test_completed_job_is_reused() -> None:
+    async def check() -> None:
+        stub = StubAttribution()
+        request = get_request()
+        async with attribution_service(stub) as service:
+            assert await run_job(service, request) == "result 1"
+            assert await run_job(service, request) == "result 1"
+
+        assert stub.calls == 1
+
+    asyncio.run(check())
+
+
+def test_failed_job_is_run_again() -> None:
+    async def check() -> None:
+        stub = StubAttribution()
+        request = get_request()
+        stub.failures_left = 1
+        async with attribution_service(stub) as service:
+            with pytest.raises(JobError):
+                await run_job(service, request)
+
+            assert await run_job(service, request) == "result 2"
+
+    asyncio.run(check())
+
+
+def test_aborting_a_finished_job_leaves_it_finished() -> None:
+    async def check() -> None:
+        stub = StubAttribution()
+        request = get_request()
+        async with attribution_service(stub) as service:
+            await run_job(service, request)
+            job_key = service._get_cache_key(_INDEX, request).hex()
+
+            await service._abort_job(job_key)
+
+            job = await service.attribution_queue.job(job_key)
+            assert job is not None
+            assert job.status == JobStatus.COMPLETE
+
+    asyncio.run(check())
+
+
+def test_job_aborted_after_it_finished_is_run_again() -> None:
+    async def check() -> None:
+        stub = StubAttribution()
+        request = get_request()
+        async with attribution_service(stub) as service:
+            await run_job(service, request)
+            job_key = service._get_cache_key(_INDEX, request).hex()
+
+            # An abort that raced the job finishing leaves it aborting with no worker to finish the abort
+            job = await service.attribution_queue.job(job_key)
+            assert job is not None
+            await service.attribution_queue.abort(job, "Client timeout")
+
+            assert await run_job(service, request) == "result 2"
+
+    asyncio.run(check())
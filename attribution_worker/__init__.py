@@ -1 +1 @@
-from .worker import settings as worker_settings  # noqa: F401
+from .worker import get_worker_settings as get_worker_settings  # noqa: F401
@@ -0,0 +1,405 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Callable, cast
+
+import numpy as np
+from infini_gram.models import AttributionSpan as AttributionSpanFromEngine
+from infini_gram_processor.models import (
+    AttributionResponse,
+    AttributionSpansEvent,
+    Document,
+    GetDocumentByPointerRequest,
+    InfiniGramAttributionResponse,
+    SpanRankingMethod,
+)
+from infini_gram_processor.processor import InfiniGramProcessor
+from opentelemetry import trace
+
+from .config import get_config
+from .get_documents import (
+    get_document_handles_by_span,
+    get_document_requests,
+    get_documents_by_span,
+    get_spans_with_document_handles,
+    get_spans_with_documents,
+    get_stream_spans,
+    sort_and_cap_spans,
+)
+from .stage_cache import (
+    DocumentRequestKey,
+    attribute_result_cache,
+    attribution_segment_cache,
+    document_cache,
+    find_previous_attribute_result,
+    get_attribute_result_key,
+    get_document_request_key,
+)
+
+tracer = trace.get_tracer(get_config().application_name)
+
+
+@dataclass
+class AttributionJobRequest:
+    input: str
+    delimiters: list[str]
+    allow_spans_with_partial_words: bool
+    minimum_span_length: int
+    maximum_frequency: int
+    maximum_span_density: float
+    span_ranking_method: SpanRankingMethod
+    maximum_context_length: int
+    maximum_context_length_long: int
+    maximum_context_length_snippet: int
+    maximum_documents_per_span: int
+    # Jobs that don't hydrate their documents return handles to them instead and skip fetching them
+    hydrate_documents: bool = True
+    # Called from the batch's thread with the job's spans as soon as they're found, before the batch fetches any documents
+    on_spans: Callable[[AttributionSpansEvent], None] | None = None
+
+
+@dataclass
+class _AttributedJob:
+    position: int
+    request: AttributionJobRequest
+    attribute_result: InfiniGramAttributionResponse
+    spans: list[AttributionSpanFromEngine]
+    document_request_by_span: list[GetDocumentByPointerRequest]
+
+
+def _fetch_documents(
+    infini_gram_index: InfiniGramProcessor,
+    document_requests: list[GetDocumentByPointerRequest],
+    document_request_keys: list[DocumentRequestKey],
+    documents_by_span: list[list[Document] | None],
+    span_positions: list[int],
+) -> None:
+    """Fetches the documents for the spans at `span_positions` in one call, filling them in `documents_by_span` and the document cache."""
+    if len(span_positions) == 0:
+        return
+
+    fetched_documents_by_span = get_documents_by_span(
+        infini_gram_index=infini_gram_index,
+        document_request_by_span=[
+            document_requests[span_position] for span_position in span_positions
+        ],
+    )
+    for span_position, documents in zip(span_positions, fetched_documents_by_span):
+        documents_by_span[span_position] = documents
+        document_cache.set(document_request_keys[span_position], documents)
+
+
+def attribute_batch(
+    infini_gram_index: InfiniGramProcessor,
+    requests: list[AttributionJobRequest],
+) -> list[AttributionResponse | Exception]:
+    """
+    Attributes several jobs' inputs against one index, tokenizing the inputs together and fetching and decoding every job's documents in one call.
+
+    A job that fails gets its exception back in its position instead of failing the jobs batched with it. If the batch's document fetch fails, each job's documents are fetched again on their own so only the jobs whose fetch fails again get the error.
+    """
+    with tracer.start_as_current_span(
+        "attribution-worker/attribute_batch", attributes={"batch_size": len(requests)}
+    ) as batch_span:
+        results: list[AttributionResponse | Exception | None] = [None] * len(requests)
+
+        attribute_result_keys = [
+            get_attribute_result_key(
+                index=infini_gram_index.index,
+                input=request.input,
+                delimiters=request.delimiters,
+                allow_spans_with_partial_words=request.allow_spans_with_partial_words,
+                minimum_span_length=request.minimum_span_length,
+                maximum_frequency=request.maximum_frequency,
+            )
+            for request in requests
+        ]
+        cached_attribute_results = [
+            attribute_result_cache.get(key) for key in attribute_result_keys
+        ]
+
+        # Inputs with a cached attribute result don't need tokenizing
+        uncached_positions = [
+            position
+            for position, attribute_result in enumerate(cached_attribute_results)
+            if attribute_result is None
+        ]
+        encoded_inputs = (
+            dict(
+                zip(
+                    uncached_positions,
+                    infini_gram_index.batch_encode(
+                        [requests[position].input for position in uncached_positions]
+                    ),
+                )
+            )
+            if len(uncached_positions) > 0
+            else {}
+        )
+        batch_span.set_attribute(
+            "attribute_result_cache_hits", len(requests) - len(uncached_positions)
+        )
+
+        attributed_jobs: list[_AttributedJob] = []
+        for position, request in enumerate(requests):
+            try:
+                attribute_result = cached_attribute_results[position]
+                if attribute_result is None:
+                    attribute_result = infini_gram_index.attribute(
+                        input=request.input,
+                        delimiters=request.delimiters,
+                        allow_spans_with_partial_words=request.allow_spans_with_partial_words,
+                        minimum_span_length=request.minimum_span_length,
+                        maximum_frequency=request.maximum_frequency,
+                        encoded_input=encoded_inputs[position],
+                        segment_cache=attribution_segment_cache,
+                        # Responses that are still being generated are attributed again as they grow, only their new tokens need the engine
+                        previous_attribute_result=find_previous_attribute_result(
+                            attribute_result_keys[position]
+                        ),
+                    )
+                    attribute_result_cache.set(
+                        attribute_result_keys[position], attribute_result
+                    )
+
+                # Limit the density of spans, and keep the longest ones
+                maximum_num_spans = int(
+                    np.ceil(
+                        len(attribute_result.input_token_ids)
+                        * request.maximum_span_density
+                    )
+                )
+
+                sorted_spans = sort_and_cap_spans(
+                    attribute_result.spans,
+                    ranking_method=request.span_ranking_method,
+                    maximum_num_spans=maximum_num_spans,
+                )
+
+                document_request_by_span = get_document_requests(
+                    spans=sorted_spans,
+                    input_token_ids=attribute_result.input_token_ids,
+                    maximum_documents_per_span=request.maximum_documents_per_span,
+                    maximum_context_length=request.maximum_context_length,
+                )
+
+                if request.on_spans is not None:
+                    request.on_spans(
+                        AttributionSpansEvent(
+                            index=infini_gram_index.index,
+                            spans=get_stream_spans(
+                                infini_gram_index=infini_gram_index,
+                                spans=sorted_spans,
+                                input_token_ids=attribute_result.input_token_ids,
+                                document_handles_by_span=None
+                                if request.hydrate_documents
+                                else get_document_handles_by_span(
+                                    document_request_by_span
+                                ),
+                            ),
+                            input_tokens=attribute_result.input_tokens,
+                        )
+                    )
+
+                if not request.hydrate_documents:
+                    results[position] = AttributionResponse(
+                        index=infini_gram_index.index,
+                        spans=get_spans_with_document_handles(
+                            infini_gram_index=infini_gram_index,
+                            spans=sorted_spans,
+                            document_handles_by_span=get_document_handles_by_span(
+                                document_request_by_span
+                            ),
+                            input_token_ids=attribute_result.input_token_ids,
+                        ),
+                        input_tokens=attribute_result.input_tokens,
+                    )
+                    continue
+
+                attributed_jobs.append(
+                    _AttributedJob(
+                        position=position,
+                        request=request,
+                        attribute_result=attribute_result,
+                        spans=sorted_spans,
+                        document_request_by_span=document_request_by_span,
+                    )
+                )
+            except Exception as e:
+                results[position] = e
+
+        document_requests = [
+            document_request
+            for attributed_job in attributed_jobs
+            for document_request in attributed_job.document_request_by_span
+        ]
+        document_request_keys = [
+            get_document_request_key(infini_gram_index.index, document_request)
+            for document_request in document_requests
+        ]
+        cached_documents_by_span = [
+            document_cache.get(key) for key in document_request_keys
+        ]
+
+        uncached_spans = [
+            span_position
+            for span_position, documents in enumerate(cached_documents_by_span)
+            if documents is None
+        ]
+        batch_span.set_attribute(
+            "document_cache_hits", len(document_requests) - len(uncached_spans)
+        )
+        try:
+            _fetch_documents(
+                infini_gram_index=infini_gram_index,
+                document_requests=document_requests,
+                document_request_keys=document_request_keys,
+                documents_by_span=cached_documents_by_span,
+                span_positions=uncached_spans,
+            )
+        except Exception as e:
+            batch_span.record_exception(e)
+
+            # One job's spans can make the engine fail the whole call, so each job's documents are fetched on their own
+            job_span_start = 0
+            for attributed_job in attributed_jobs:
+                job_span_positions = range(
+                    job_span_start, job_span_start + len(attributed_job.spans)
+                )
+                job_span_start += len(attributed_job.spans)
+
+                try:
+                    _fetch_documents(
+                        infini_gram_index=infini_gram_index,
+                        document_requests=document_requests,
+                        document_request_keys=document_request_keys,
+                        documents_by_span=cached_documents_by_span,
+                        span_positions=[
+                            span_position
+                            for span_position in job_span_positions
+                            if cached_documents_by_span[span_position] is None
+                        ],
+                    )
+                except Exception as job_exception:
+                    results[attributed_job.position] = job_exception
+
+        job_span_start = 0
+        for attributed_job in attributed_jobs:
+            job_documents_by_span = cached_documents_by_span[
+                job_span_start : job_span_start + len(attributed_job.spans)
+            ]
+            job_span_start += len(attributed_job.spans)
+
+            # The job's documents couldn't be fetched
+            if results[attributed_job.position] is not None:
+                continue
+
+            try:
+                results[attributed_job.position] = AttributionResponse(
+                    index=infini_gram_index.index,
+                    spans=get_spans_with_documents(
+                        infini_gram_index=infini_gram_index,
+                        spans=attributed_job.spans,
+                        documents_by_span=cast(
+                            list[list[Document]], job_documents_by_span
+                        ),
+                        input_token_ids=attributed_job.attribute_result.input_token_ids,
+                        maximum_context_length_long=attributed_job.request.maximum_context_length_long,
+                        maximum_context_length_snippet=attributed_job.request.maximum_context_length_snippet,
+                    ),
+                    input_tokens=attributed_job.attribute_result.input_tokens,
+                )
+            except Exception as e:
+                results[attributed_job.position] = e
+
+        # Every job got either its response or its exception above
+        return cast(list[AttributionResponse | Exception], results)
+
+
+@dataclass
+class _PendingBatch:
+    infini_gram_index: InfiniGramProcessor
+    requests: list[AttributionJobRequest] = field(default_factory=list)
+    futures: list["asyncio.Future[AttributionResponse]"] = field(default_factory=list)
+    flush_handle: asyncio.TimerHandle | None = None
+
+
+class AttributionBatcher:
+    """
+    Collects attribution jobs for the same index that arrive within `batch_window_seconds` of each other, up to `maximum_batch_size` of them, and runs them with `attribute_batch`.
+
+    A job waits at most one window for others to join it, and a full batch runs right away.
+    """
+
+    maximum_batch_size: int
+    batch_window_seconds: float
+
+    def __init__(self, maximum_batch_size: int, batch_window_seconds: float):
+        if maximum_batch_size < 1:
+            raise ValueError("maximum_batch_size must be at least 1")
+
+        self.maximum_batch_size = maximum_batch_size
+        self.batch_window_seconds = batch_window_seconds
+        self._pending_batches: dict[str, _PendingBatch] = {}
+        self._running_batches: set[asyncio.Task[None]] = set()
+
+    async def attribute(
+        self, infini_gram_index: InfiniGramProcessor, request: AttributionJobRequest
+    ) -> AttributionResponse:
+        loop = asyncio.get_running_loop()
+
+        batch = self._pending_batches.get(infini_gram_index.index)
+        if batch is None:
+            batch = _PendingBatch(infini_gram_index=infini_gram_index)
+            self._pending_batches[infini_gram_index.index] = batch
+            batch.flush_handle = loop.call_later(
+                self.batch_window_seconds, self._flush, infini_gram_index.index
+            )
+
+        future: asyncio.Future[AttributionResponse] = loop.create_future()
+        batch.requests.append(request)
+        batch.futures.append(future)
+
+        if len(batch.requests) >= self.maximum_batch_size:
+            self._flush(infini_gram_index.index)
+
+        return await future
+
+    def _flush(self, index: str) -> None:
+        batch = self._pending_batches.pop(index, None)
+        if batch is None:
+            return
+
+        if batch.flush_handle is not None:
+            batch.flush_handle.cancel()
+
+        # Keep a reference to the task so it isn't garbage collected while it runs
+        task = asyncio.create_task(self._run(batch))
+        self._running_batches.add(task)
+        task.add_done_callback(self._running_batches.discard)
+
+    async def _run(self, batch: _PendingBatch) -> None:
+        try:
+            results = await asyncio.to_thread(
+                attribute_batch, batch.infini_gram_index, batch.requests
+            )
+        except Exception as e:
+            for future in batch.futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, result in zip(batch.futures, results):
+            # Jobs that were aborted while the batch ran have already been cancelled
+            if future.done():
+                continue
+
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+attribution_batcher = AttributionBatcher(
+    maximum_batch_size=get_config().attribution_batch_size,
+    batch_window_seconds=get_config().attribution_batch_window_seconds,
+)
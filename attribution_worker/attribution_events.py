@@ -0,0 +1,34 @@
+from functools import lru_cache
+from typing import Sequence
+
+import redis.asyncio as redis
+from infini_gram_processor.models import AttributionStreamEvent
+
+from .config import get_config
+
+# Readers that start after the job finished can still read every event for a while, readers of jobs that never finish stop waiting long before this
+_EVENTS_TTL_SECONDS = 300
+_FINISHED_EVENTS_TTL_SECONDS = 60
+
+
+@lru_cache
+def get_events_redis() -> redis.Redis:
+    pool = redis.ConnectionPool.from_url(get_config().attribution_events_url)
+
+    return redis.Redis(connection_pool=pool)
+
+
+async def publish_attribution_events(
+    job_key: str, events: Sequence[AttributionStreamEvent], finished: bool = False
+) -> None:
+    """Appends events to a job's Redis stream, which the API reads from the start so requests that join a job late don't miss any."""
+    events_key = get_config().get_attribution_events_key(job_key)
+
+    async with get_events_redis().pipeline(transaction=False) as pipeline:
+        for event in events:
+            pipeline.xadd(events_key, {"event": event.model_dump_json(by_alias=True)})
+        pipeline.expire(
+            events_key,
+            _FINISHED_EVENTS_TTL_SECONDS if finished else _EVENTS_TTL_SECONDS,
+        )
+        await pipeline.execute()
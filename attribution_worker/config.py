@@ -9,6 +9,21 @@ class Config(BaseSettings):
     application_name: str = "infini-gram-api-worker"
     attribution_queue_url: str = "redis://localhost:6379"
     python_env: str = "prod"
+    # The Redis that streamed attributions' events are written to, the API reads them from its ATTRIBUTION_EVENTS_URL or CACHE_URL
+    attribution_events_url: str = "redis://localhost:6379"
+    # Indexes this worker pulls jobs for, each index has its own queue. Unset means every index
+    served_indexes: list[str] | None = None
+    # Forks this many worker processes that each pull jobs from every served index's queue, see worker_pool.py
+    worker_processes: int = 1
+    # Indexes to load before forking worker processes so they're shared, the rest are loaded by each process when it first needs them. Unset means every served index
+    preloaded_indexes: list[str] | None = None
+    # Jobs for the same index that arrive within the window are attributed together, see attribution_batcher.py. This is also how many jobs a worker process runs at once
+    attribution_batch_size: int = 8
+    attribution_batch_window_seconds: float = 0.005
+    # How many engine attribute results and spans' fetched documents each worker process keeps, see stage_cache.py. Set to 0 to turn them off
+    attribute_result_cache_size: int = 256
+    attribution_segment_cache_size: int = 4096
+    document_cache_size: int = 1024
 
     @computed_field  # type: ignore[prop-decorator]
     @property
@@ -17,6 +32,12 @@ class Config(BaseSettings):
 
         return f"{queue_prefix}-{self.python_env}"
 
+    def get_attribution_queue_name(self, index: str) -> str:
+        return f"{self.attribution_queue_name}-{index}"
+
+    def get_attribution_events_key(self, job_key: str) -> str:
+        return f"{self.attribution_queue_name}-events:{job_key}"
+
 
 config = Config()
 
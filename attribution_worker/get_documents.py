@@ -1,9 +1,12 @@
 import random
+from typing import NamedTuple
 
 from infini_gram.models import AttributionSpan as AttributionSpanFromEngine
+from infini_gram_processor.attribution_documents import get_attribution_document
 from infini_gram_processor.models import (
-    AttributionDocument,
+    AttributionDocumentHandle,
     AttributionSpan,
+    AttributionStreamSpan,
     Document,
     GetDocumentByPointerRequest,
     SpanRankingMethod,
@@ -13,25 +16,6 @@ from infini_gram_processor.processor import InfiniGramProcessor
 from .get_span_text import get_span_text
 
 
-def cut_document(
-    infini_gram_index: InfiniGramProcessor,
-    token_ids: list[int],
-    needle_offset: int,
-    span_length: int,
-    maximum_context_length: int,
-) -> tuple[int, int, str]:
-    # cut the left context if necessary
-    if needle_offset > maximum_context_length:
-        token_ids = token_ids[(needle_offset - maximum_context_length) :]
-        needle_offset = maximum_context_length
-    # cut the right context if necessary
-    if len(token_ids) - needle_offset - span_length > maximum_context_length:
-        token_ids = token_ids[: (needle_offset + span_length + maximum_context_length)]
-    display_length = len(token_ids)
-    text = infini_gram_index.decode_tokens(token_ids)
-    return display_length, needle_offset, text
-
-
 def get_spans_with_documents(
     infini_gram_index: InfiniGramProcessor,
     spans: list[AttributionSpanFromEngine],
@@ -42,35 +26,16 @@ def get_spans_with_documents(
 ) -> list[AttributionSpan]:
     spans_with_documents: list[AttributionSpan] = []
     for span, documents in zip(spans, documents_by_span):
-        span_documents: list[AttributionDocument] = []
-        for document in documents:
-            display_length_long, needle_offset_long, text_long = cut_document(
+        span_documents = [
+            get_attribution_document(
                 infini_gram_index=infini_gram_index,
-                token_ids=document.token_ids,
-                needle_offset=document.needle_offset,
+                document=document,
                 span_length=span["length"],
-                maximum_context_length=maximum_context_length_long,
-            )
-
-            display_length_snippet, needle_offset_snippet, text_snippet = cut_document(
-                infini_gram_index=infini_gram_index,
-                token_ids=document.token_ids,
-                needle_offset=document.needle_offset,
-                span_length=span["length"],
-                maximum_context_length=maximum_context_length_snippet,
-            )
-
-            span_documents.append(
-                AttributionDocument(
-                    **vars(document),
-                    display_length_long=display_length_long,
-                    needle_offset_long=needle_offset_long,
-                    text_long=text_long,
-                    display_offset_snippet=display_length_snippet,
-                    needle_offset_snippet=needle_offset_snippet,
-                    text_snippet=text_snippet,
-                )
+                maximum_context_length_long=maximum_context_length_long,
+                maximum_context_length_snippet=maximum_context_length_snippet,
             )
+            for document in documents
+        ]
 
         (span_text_tokens, span_text) = get_span_text(
             infini_gram_index=infini_gram_index,
@@ -95,6 +60,68 @@ def get_spans_with_documents(
     return spans_with_documents
 
 
+def get_stream_spans(
+    infini_gram_index: InfiniGramProcessor,
+    spans: list[AttributionSpanFromEngine],
+    input_token_ids: list[int],
+    document_handles_by_span: list[list[AttributionDocumentHandle]] | None = None,
+) -> list[AttributionStreamSpan]:
+    stream_spans: list[AttributionStreamSpan] = []
+    for span_index, span in enumerate(spans):
+        (span_text_tokens, span_text) = get_span_text(
+            infini_gram_index=infini_gram_index,
+            input_token_ids=input_token_ids,
+            start=span["l"],
+            stop=span["r"],
+        )
+
+        stream_spans.append(
+            AttributionStreamSpan(
+                left=span["l"],
+                right=span["r"],
+                length=span["length"],
+                count=span["count"],
+                unigram_logprob_sum=span["unigram_logprob_sum"],
+                text=span_text,
+                token_ids=span_text_tokens,
+                document_handles=document_handles_by_span[span_index]
+                if document_handles_by_span is not None
+                else [],
+            )
+        )
+
+    return stream_spans
+
+
+def get_spans_with_document_handles(
+    infini_gram_index: InfiniGramProcessor,
+    spans: list[AttributionSpanFromEngine],
+    document_handles_by_span: list[list[AttributionDocumentHandle]],
+    input_token_ids: list[int],
+) -> list[AttributionSpan]:
+    return [
+        AttributionSpan(**stream_span.model_dump(), documents=[])
+        for stream_span in get_stream_spans(
+            infini_gram_index=infini_gram_index,
+            spans=spans,
+            input_token_ids=input_token_ids,
+            document_handles_by_span=document_handles_by_span,
+        )
+    ]
+
+
+def get_document_handles_by_span(
+    document_request_by_span: list[GetDocumentByPointerRequest],
+) -> list[list[AttributionDocumentHandle]]:
+    return [
+        [
+            AttributionDocumentHandle(shard=doc["s"], pointer=doc["ptr"])
+            for doc in document_request.docs
+        ]
+        for document_request in document_request_by_span
+    ]
+
+
 def get_document_requests(
     spans: list[AttributionSpanFromEngine],
     input_token_ids: list[int],
@@ -118,6 +145,145 @@ def get_document_requests(
     return document_request_by_span
 
 
+class _DocumentPointer(NamedTuple):
+    span_index: int
+    document_index: int
+    shard: int
+    pointer: int
+    needle_length: int
+    maximum_context_length: int
+
+
+def _group_document_pointers(
+    document_request_by_span: list[GetDocumentByPointerRequest],
+) -> list[list[_DocumentPointer]]:
+    document_pointers = sorted(
+        (
+            _DocumentPointer(
+                span_index=span_index,
+                document_index=document_index,
+                shard=doc["s"],
+                pointer=doc["ptr"],
+                needle_length=document_request.needle_length,
+                maximum_context_length=document_request.maximum_context_length,
+            )
+            for span_index, document_request in enumerate(document_request_by_span)
+            for document_index, doc in enumerate(document_request.docs)
+        ),
+        key=lambda document_pointer: (document_pointer.shard, document_pointer.pointer),
+    )
+
+    # Pointers are byte offsets into a shard's u16 tokens. Neighboring pointers whose context windows overlap are fetched together
+    groups: list[list[_DocumentPointer]] = []
+    group_end = 0
+    for document_pointer in document_pointers:
+        window_start = document_pointer.pointer - 2 * (
+            document_pointer.maximum_context_length
+        )
+        window_end = document_pointer.pointer + 2 * (
+            document_pointer.needle_length + document_pointer.maximum_context_length
+        )
+
+        if (
+            len(groups) > 0
+            and groups[-1][0].shard == document_pointer.shard
+            and window_start <= group_end
+        ):
+            groups[-1].append(document_pointer)
+            group_end = max(group_end, window_end)
+        else:
+            groups.append([document_pointer])
+            group_end = window_end
+
+    return groups
+
+
+def _get_group_request(
+    group: list[_DocumentPointer],
+    document_request_by_span: list[GetDocumentByPointerRequest],
+) -> GetDocumentByPointerRequest:
+    first_pointer = group[0].pointer
+
+    # Treat everything from the first needle to the end of the last one as one needle so every pointer's context is fetched
+    return GetDocumentByPointerRequest(
+        docs=[{"s": group[0].shard, "ptr": first_pointer}],
+        span_ids=document_request_by_span[group[0].span_index].span_ids,
+        needle_length=max(
+            (document_pointer.pointer - first_pointer) // 2
+            + document_pointer.needle_length
+            for document_pointer in group
+        ),
+        maximum_context_length=max(
+            document_pointer.maximum_context_length for document_pointer in group
+        ),
+    )
+
+
+def get_documents_by_span(
+    infini_gram_index: InfiniGramProcessor,
+    document_request_by_span: list[GetDocumentByPointerRequest],
+) -> list[list[Document]]:
+    """
+    Fetches the documents for every span, reading and decoding each part of a document only once even when several spans found it.
+
+    Pointers that are close enough for their context windows to overlap are fetched as one window, then each span's document is cut out of it.
+    """
+    # Whether a document is blocked depends on the span that found it, so spans can't share documents
+    if infini_gram_index.has_index_diff:
+        return infini_gram_index.get_documents_by_pointers(
+            document_request_by_span=document_request_by_span
+        )
+
+    documents_by_span: list[list[Document | None]] = [
+        [None] * len(document_request.docs)
+        for document_request in document_request_by_span
+    ]
+
+    groups = _group_document_pointers(document_request_by_span)
+    while len(groups) > 0:
+        group_documents = infini_gram_index.get_documents_by_pointers(
+            document_request_by_span=[
+                _get_group_request(group, document_request_by_span) for group in groups
+            ]
+        )
+
+        ungrouped_pointers: list[_DocumentPointer] = []
+        for group, (group_document,) in zip(groups, group_documents):
+            first_pointer = group[0].pointer
+            for document_pointer in group:
+                needle_offset = (
+                    group_document.needle_offset
+                    + (document_pointer.pointer - first_pointer) // 2
+                )
+
+                # A group can run past the end of its first pointer's document, those pointers are fetched again on their own
+                if (
+                    needle_offset + document_pointer.needle_length
+                    > group_document.display_length
+                ):
+                    ungrouped_pointers.append(document_pointer)
+                    continue
+
+                documents_by_span[document_pointer.span_index][
+                    document_pointer.document_index
+                ] = group_document.get_window(
+                    start=max(
+                        0, needle_offset - document_pointer.maximum_context_length
+                    ),
+                    stop=needle_offset
+                    + document_pointer.needle_length
+                    + document_pointer.maximum_context_length,
+                    needle_offset=needle_offset,
+                )
+
+        groups = [[document_pointer] for document_pointer in ungrouped_pointers]
+
+    return [
+        [document for document in documents if document is not None]
+        for documents in documents_by_span
+    ]
+
+
 def sort_and_cap_spans(
     spans: list[AttributionSpanFromEngine],
     ranking_method: SpanRankingMethod,
@@ -0,0 +1,139 @@
+import threading
+from collections import OrderedDict
+from typing import Generic, Hashable, TypeVar
+
+from infini_gram.models import AttributionSpan as AttributionSpanFromEngine
+from infini_gram_processor.attribution_segments import AttributionSegmentKey
+from infini_gram_processor.models import (
+    Document,
+    GetDocumentByPointerRequest,
+    InfiniGramAttributionResponse,
+)
+
+from .config import get_config
+
+KeyT = TypeVar("KeyT", bound=Hashable)
+ValueT = TypeVar("ValueT")
+
+
+class StageCache(Generic[KeyT, ValueT]):
+    """
+    An LRU cache for the results of one stage of attribution, keyed by only the parameters that stage depends on so jobs that differ in later stages' parameters can reuse them.
+
+    Cached results are shared between jobs, so callers shouldn't modify them.
+    """
+
+    maximum_size: int
+    hits: int
+    misses: int
+
+    def __init__(self, maximum_size: int):
+        self.maximum_size = maximum_size
+        self.hits = 0
+        self.misses = 0
+
+        self._entries: OrderedDict[KeyT, ValueT] = OrderedDict()
+        # Batches for different indexes run on their own threads
+        self._lock = threading.Lock()
+
+    def get(self, key: KeyT) -> ValueT | None:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: KeyT, value: ValueT) -> None:
+        if self.maximum_size <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maximum_size:
+                self._entries.popitem(last=False)
+
+    def items(self) -> list[tuple[KeyT, ValueT]]:
+        with self._lock:
+            return list(self._entries.items())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+AttributeResultKey = tuple[str, str, tuple[str, ...], bool, int, int]
+DocumentRequestKey = tuple[str, tuple[tuple[int, int], ...], tuple[int, ...], int, int]
+
+
+def get_attribute_result_key(
+    index: str,
+    input: str,
+    delimiters: list[str],
+    allow_spans_with_partial_words: bool,
+    minimum_span_length: int,
+    maximum_frequency: int,
+) -> AttributeResultKey:
+    return (
+        index,
+        input,
+        tuple(delimiters),
+        allow_spans_with_partial_words,
+        minimum_span_length,
+        maximum_frequency,
+    )
+
+
+def find_previous_attribute_result(
+    key: AttributeResultKey,
+) -> InfiniGramAttributionResponse | None:
+    """Finds the cached attribute result for the longest earlier version of the key's input, an input it starts with that was attributed with the same parameters."""
+    index, input, *parameters = key
+
+    previous_input_length = 0
+    previous_attribute_result: InfiniGramAttributionResponse | None = None
+    for (
+        cached_index,
+        cached_input,
+        *cached_parameters,
+    ), attribute_result in attribute_result_cache.items():
+        if (
+            cached_index == index
+            and cached_parameters == parameters
+            and previous_input_length < len(cached_input) < len(input)
+            and input.startswith(cached_input)
+        ):
+            previous_input_length = len(cached_input)
+            previous_attribute_result = attribute_result
+
+    return previous_attribute_result
+
+
+def get_document_request_key(
+    index: str, document_request: GetDocumentByPointerRequest
+) -> DocumentRequestKey:
+    return (
+        index,
+        tuple((doc["s"], doc["ptr"]) for doc in document_request.docs),
+        tuple(document_request.span_ids),
+        document_request.needle_length,
+        document_request.maximum_context_length,
+    )
+
+
+# The engine's spans for an input, before they're capped and have their documents fetched
+attribute_result_cache = StageCache[AttributeResultKey, InfiniGramAttributionResponse](
+    get_config().attribute_result_cache_size
+)
+# The engine's spans for one delimiter-separated segment of an input, so inputs that share sentences reuse them
+attribution_segment_cache = StageCache[
+    AttributionSegmentKey, list[AttributionSpanFromEngine]
+](get_config().attribution_segment_cache_size)
+# The documents fetched for one span, before they're cut down to the long and snippet contexts
+document_cache = StageCache[DocumentRequestKey, list[Document]](
+    get_config().document_cache_size
+)
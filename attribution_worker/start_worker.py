@@ -37,5 +37,5 @@ if __name__ == "__main__":
     create_missing_directories()
     print("Starting attribution worker...")
     
-    # Start the original worker command
-    subprocess.run(["saq", "--web", "attribution_worker.worker_settings"], check=True) 
\ No newline at end of file
+    # Starts saq, forking worker processes for each served index
+    subprocess.run([sys.executable, "-m", "attribution_worker.worker_pool"], check=True)
@@ -1,15 +1,17 @@
 import asyncio
+import concurrent.futures
 import os
 from typing import Any
 
-import numpy as np
+from infini_gram_processor import get_index_warmup, indexes
+from infini_gram_processor.attribution_stream import get_attribution_documents_events
 from infini_gram_processor.index_mappings import AvailableInfiniGramIndexId
 from infini_gram_processor.models import (
-    SpanRankingMethod,
-)
-from infini_gram_processor.models.models import (
+    AttributionDoneEvent,
+    AttributionErrorEvent,
     AttributionResponse,
-    AttributionSpan,
+    AttributionSpansEvent,
+    SpanRankingMethod,
 )
 from opentelemetry import trace
 from opentelemetry.exporter.cloud_trace import CloudTraceSpanExporter
@@ -22,19 +24,14 @@ from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapProp
 from saq import Queue
 from saq.types import Context, SettingsDict
 
+from .attribution_batcher import AttributionJobRequest, attribution_batcher
+from .attribution_events import publish_attribution_events
 from .config import get_config
-from .get_documents import (
-    get_document_requests,
-    get_spans_with_documents,
-    sort_and_cap_spans,
-)
 
 _TASK_RUN = "run"
 
 config = get_config()
 
-queue = Queue.from_url(config.attribution_queue_url, name=config.attribution_queue_name)
-
 tracer_provider = TracerProvider()
 
 if os.getenv("ENV") == "development":
@@ -53,50 +50,14 @@ tracer = trace.get_tracer(config.application_name)
 _TASK_NAME_KEY = "saq.task_name"
 _TASK_TAG_KEY = "saq.action"
 
-# Lazy initialization of indexes
-_indexes = None
-
-def get_indexes():
-    global _indexes
-    if _indexes is None:
-        from infini_gram_processor import indexes as all_indexes
-        from infini_gram_processor.index_mappings import AvailableInfiniGramIndexId
-        import os
-        
-        # Only initialize indexes that have valid directories
-        available_indexes = {}
-        for index_id in AvailableInfiniGramIndexId:
-            try:
-                # Check if the index directory exists
-                index_dir = f"/mnt/infinigram-array/{index_id.value}"
-                if os.path.exists(index_dir) and os.path.isdir(index_dir):
-                    # Only try to initialize if directory exists
-                    available_indexes[index_id] = all_indexes[index_id]
-            except Exception as e:
-                print(f"Warning: Could not initialize index {index_id.value}: {e}")
-                continue
-        
-        _indexes = available_indexes
-    return _indexes
 
-
-async def attribution_job(
+async def _attribute(
     ctx: Context,
-    *,
+    task_name: str,
     index: str,
-    input: str,
-    delimiters: list[str],
-    allow_spans_with_partial_words: bool,
-    minimum_span_length: int,
-    maximum_frequency: int,
-    maximum_span_density: float,
-    span_ranking_method: SpanRankingMethod,
-    maximum_context_length: int,
-    maximum_context_length_long: int,
-    maximum_context_length_snippet: int,
-    maximum_documents_per_span: int,
+    request: AttributionJobRequest,
     otel_context: dict[str, Any],
-) -> str:
+) -> AttributionResponse:
     extracted_context = TraceContextTextMapPropagator().extract(carrier=otel_context)
     with tracer.start_as_current_span(
         "attribution-worker/attribute",
@@ -104,7 +65,7 @@ async def attribution_job(
         context=extracted_context,
         attributes={
             SpanAttributes.MESSAGING_SYSTEM: "saq",
-            _TASK_NAME_KEY: "attribute",
+            _TASK_NAME_KEY: task_name,
             _TASK_TAG_KEY: "apply_async",
         },
     ) as otel_span:
@@ -116,58 +77,131 @@ async def attribution_job(
         if worker is not None:
             otel_span.set_attribute(SpanAttributes.MESSAGING_CLIENT_ID, worker.id)
 
-        indexes = get_indexes()
-        infini_gram_index = indexes[AvailableInfiniGramIndexId(index)]
+        # The first job for an index loads its engine, so keep that off the event loop
+        infini_gram_index = await asyncio.to_thread(
+            indexes.__getitem__, AvailableInfiniGramIndexId(index)
+        )
+
+        return await attribution_batcher.attribute(infini_gram_index, request)
+
 
-        attribute_result = await asyncio.to_thread(
-            infini_gram_index.attribute,
+async def attribution_job(
+    ctx: Context,
+    *,
+    index: str,
+    input: str,
+    delimiters: list[str],
+    allow_spans_with_partial_words: bool,
+    minimum_span_length: int,
+    maximum_frequency: int,
+    maximum_span_density: float,
+    span_ranking_method: SpanRankingMethod,
+    maximum_context_length: int,
+    maximum_context_length_long: int,
+    maximum_context_length_snippet: int,
+    maximum_documents_per_span: int,
+    otel_context: dict[str, Any],
+    hydrate_documents: bool = True,
+) -> str:
+    response = await _attribute(
+        ctx,
+        task_name="attribute",
+        index=index,
+        request=AttributionJobRequest(
             input=input,
             delimiters=delimiters,
             allow_spans_with_partial_words=allow_spans_with_partial_words,
             minimum_span_length=minimum_span_length,
             maximum_frequency=maximum_frequency,
-        )
+            maximum_span_density=maximum_span_density,
+            span_ranking_method=span_ranking_method,
+            maximum_context_length=maximum_context_length,
+            maximum_context_length_long=maximum_context_length_long,
+            maximum_context_length_snippet=maximum_context_length_snippet,
+            maximum_documents_per_span=maximum_documents_per_span,
+            hydrate_documents=hydrate_documents,
+        ),
+        otel_context=otel_context,
+    )
+    # Serialized the way the API serializes its responses, so the API can send it on as-is
+    return response.model_dump_json(by_alias=True)
 
-        # Limit the density of spans, and keep the longest ones
-        maximum_num_spans = int(
-            np.ceil(len(attribute_result.input_token_ids) * maximum_span_density)
-        )
 
-        sorted_spans = sort_and_cap_spans(
-            attribute_result.spans,
-            ranking_method=span_ranking_method,
-            maximum_num_spans=maximum_num_spans,
+async def attribution_stream_job(
+    ctx: Context,
+    *,
+    index: str,
+    otel_context: dict[str, Any],
+    # The same arguments attribution_job takes
+    **request_kwargs: Any,
+) -> str:
+    """Attributes like attribution_job, also publishing the spans to the job's event stream as soon as they're found and then each span's documents."""
+    job_key: str = ctx["job"].key
+    loop = asyncio.get_running_loop()
+    published_spans: list[concurrent.futures.Future[None]] = []
+
+    def publish_spans(spans_event: AttributionSpansEvent) -> None:
+        published_spans.append(
+            asyncio.run_coroutine_threadsafe(
+                publish_attribution_events(job_key, [spans_event]), loop
+            )
         )
 
-        document_request_by_span = get_document_requests(
-            spans=sorted_spans,
-            input_token_ids=attribute_result.input_token_ids,
-            maximum_documents_per_span=maximum_documents_per_span,
-            maximum_context_length=maximum_context_length,
+    try:
+        response = await _attribute(
+            ctx,
+            task_name="attribute_stream",
+            index=index,
+            request=AttributionJobRequest(**request_kwargs, on_spans=publish_spans),
+            otel_context=otel_context,
         )
-
-        documents_by_span = await asyncio.to_thread(
-            infini_gram_index.get_documents_by_pointers,
-            document_request_by_span=document_request_by_span,
+    except Exception as e:
+        await publish_attribution_events(
+            job_key, [AttributionErrorEvent(detail=str(e))], finished=True
         )
+        raise
 
-        spans_with_documents: list[AttributionSpan] = get_spans_with_documents(
-            infini_gram_index=infini_gram_index,
-            spans=sorted_spans,
-            documents_by_span=documents_by_span,
-            input_token_ids=attribute_result.input_token_ids,
-            maximum_context_length_long=maximum_context_length_long,
-            maximum_context_length_snippet=maximum_context_length_snippet,
-        )
+    # The spans have to be in the stream before their documents
+    for published_span in published_spans:
+        await asyncio.wrap_future(published_span)
 
-        response = AttributionResponse(
-            index=infini_gram_index.index,
-            spans=spans_with_documents,
-            input_tokens=infini_gram_index.tokenize_to_list(input),
-        )
-        return response.model_dump_json()
+    await publish_attribution_events(
+        job_key,
+        [*get_attribution_documents_events(response), AttributionDoneEvent()],
+        finished=True,
+    )
 
+    return response.model_dump_json(by_alias=True)
 
-settings = SettingsDict(
-    queue=queue, functions=[("attribute", attribution_job)], concurrency=1
-)
+
+async def startup(ctx: Context) -> None:
+    # Jobs aren't pulled off the queue until startup finishes, so this keeps the worker from taking work before its indexes are warm
+    await asyncio.to_thread(get_index_warmup().run)
+
+
+def get_served_indexes() -> list[AvailableInfiniGramIndexId]:
+    if config.served_indexes is None:
+        return list(AvailableInfiniGramIndexId)
+
+    return [AvailableInfiniGramIndexId(index) for index in config.served_indexes]
+
+
+def get_attribution_queue(index: AvailableInfiniGramIndexId) -> Queue:
+    return Queue.from_url(
+        config.attribution_queue_url,
+        name=config.get_attribution_queue_name(index.value),
+    )
+
+
+def get_worker_settings(index: AvailableInfiniGramIndexId) -> SettingsDict:
+    """Settings for a saq worker that pulls jobs off of `index`'s queue."""
+    return SettingsDict(
+        queue=get_attribution_queue(index),
+        functions=[
+            ("attribute", attribution_job),
+            ("attribute_stream", attribution_stream_job),
+        ],
+        # Jobs have to run concurrently for the batcher to group them
+        concurrency=config.attribution_batch_size,
+        startup=startup,
+    )
@@ -0,0 +1,155 @@
+"""
+Runs the attribution worker. Every worker process runs a saq worker for each served index's queue on one event loop, and WORKER_PROCESSES of them are forked when it's more than 1.
+
+PRELOADED_INDEXES, every served index unless it's set, are loaded and warmed before forking so every worker process shares their memory copy-on-write instead of loading its own. Each worker process pulls jobs from the queues on its own, so one long job only holds up its own process.
+"""
+
+import asyncio
+import gc
+import multiprocessing
+import signal
+from multiprocessing.connection import wait
+from multiprocessing.process import BaseProcess
+from types import FrameType
+
+from infini_gram_processor import get_index_warmup, indexes
+from infini_gram_processor.index_mappings import AvailableInfiniGramIndexId
+from saq.worker import Worker
+
+from .config import get_config
+from .worker import get_served_indexes, get_worker_settings
+
+_STOP_TIMEOUT_SECONDS = 30
+_WEB_PORT = 8080
+
+
+def preload_indexes(preloaded_indexes: list[AvailableInfiniGramIndexId]) -> None:
+    for index in preloaded_indexes:
+        indexes[index]
+
+    get_index_warmup().run()
+
+
+def run_workers(
+    served_indexes: list[AvailableInfiniGramIndexId], serve_web: bool
+) -> None:
+    """Runs a saq worker for each of `served_indexes`' queues the way saq.worker.start does, serving saq's web UI for them if `serve_web` is set."""
+    loop = asyncio.new_event_loop()
+    workers = [Worker(**get_worker_settings(index)) for index in served_indexes]
+
+    for worker in workers:
+        # A loop only keeps one handler per signal, so the workers are stopped together below instead of each setting its own
+        worker.SIGNALS = []
+
+    async def worker_start(worker: Worker) -> None:
+        try:
+            await worker.queue.connect()
+            await worker.start()
+        finally:
+            await worker.queue.disconnect()
+
+    async def stop() -> None:
+        await asyncio.gather(*(worker.stop() for worker in workers))
+
+    async def workers_start() -> None:
+        await asyncio.gather(*(worker_start(worker) for worker in workers))
+
+    if not serve_web:
+        for signum in Worker.SIGNALS:
+            loop.add_signal_handler(signum, lambda: loop.create_task(stop()))
+
+        loop.run_until_complete(workers_start())
+        return
+
+    import aiohttp.web
+    from saq.web.aiohttp import create_app
+
+    async def shutdown(_app: aiohttp.web.Application) -> None:
+        await stop()
+
+    # aiohttp's run_app stops the app, and with it the workers, on SIGINT and SIGTERM
+    app = create_app([worker.queue for worker in workers])
+    app.on_shutdown.append(shutdown)
+
+    loop.create_task(workers_start())
+    aiohttp.web.run_app(app, port=_WEB_PORT, loop=loop)
+
+
+def run_worker_process(
+    served_indexes: list[AvailableInfiniGramIndexId], serve_web: bool
+) -> None:
+    # Children inherit the supervisor's handlers, run_workers sets up its own on the loop
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    run_workers(served_indexes, serve_web)
+
+
+def main() -> None:
+    config = get_config()
+    served_indexes = get_served_indexes()
+
+    # Without forking, indexes load lazily the first time one of their jobs comes in
+    if config.worker_processes <= 1:
+        run_workers(served_indexes, serve_web=True)
+        return
+
+    preload_indexes(
+        served_indexes
+        if config.preloaded_indexes is None
+        else [AvailableInfiniGramIndexId(index) for index in config.preloaded_indexes]
+    )
+
+    # Moves everything loaded so far out of the collector's reach, otherwise collections in the children touch those objects and copy their pages
+    gc.collect()
+    gc.freeze()
+
+    fork_context = multiprocessing.get_context("fork")
+
+    def start_worker_process(worker_number: int) -> BaseProcess:
+        # Only one process serves saq's web UI, which is also the worker's health check
+        process = fork_context.Process(
+            target=run_worker_process,
+            kwargs={
+                "served_indexes": served_indexes,
+                "serve_web": worker_number == 0,
+            },
+            name=f"attribution-worker-{worker_number}",
+        )
+        process.start()
+        return process
+
+    processes = {
+        worker_number: start_worker_process(worker_number)
+        for worker_number in range(config.worker_processes)
+    }
+
+    stopping = False
+
+    def stop(signum: int, frame: FrameType | None) -> None:
+        nonlocal stopping
+        stopping = True
+        for process in processes.values():
+            process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while not stopping:
+        wait([process.sentinel for process in processes.values()])
+
+        for worker_number, process in list(processes.items()):
+            if not stopping and not process.is_alive():
+                print(
+                    f"{process.name} exited with code {process.exitcode}, restarting it"
+                )
+                processes[worker_number] = start_worker_process(worker_number)
+
+    for process in processes.values():
+        process.join(_STOP_TIMEOUT_SECONDS)
+        if process.is_alive():
+            process.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,16 @@
+from .engine_profiles import EngineProfile as EngineProfile
+from .engine_profiles import EngineProfileName as EngineProfileName
 from .index_mappings import AvailableInfiniGramIndexId as AvailableInfiniGramIndexId
 from .index_mappings import index_mappings as index_mappings
+from .index_registry import InfiniGramIndexRegistry as InfiniGramIndexRegistry
+from .index_registry import indexes as indexes
+from .index_warmup import IndexWarmup as IndexWarmup
+from .index_warmup import get_index_warmup as get_index_warmup
 from .infini_gram_engine_exception import (
     InfiniGramEngineException as InfiniGramEngineException,
 )
 from .models.camel_case_model import CamelCaseModel as CamelCaseModel
 from .processor import InfiniGramProcessor as InfiniGramProcessor
-from .processor import indexes as indexes
+from .tokenizers.tokenizer import EncodedText as EncodedText
 from .tokenizers.tokenizer import Tokenizer as Tokenizer
 from .tokenizers.tokenizer_factory import get_llama_2_tokenizer as get_llama_2_tokenizer
@@ -0,0 +1,63 @@
+from .models import AttributionDocument, Document
+from .processor import InfiniGramProcessor
+from .tokenizers.decoded_tokens import DecodedTokens
+
+
+def cut_document(
+    decoded_tokens: DecodedTokens,
+    needle_offset: int,
+    span_length: int,
+    maximum_context_length: int,
+) -> tuple[int, int, str]:
+    start = 0
+    stop = len(decoded_tokens.token_ids)
+    # cut the left context if necessary
+    if needle_offset > maximum_context_length:
+        start = needle_offset - maximum_context_length
+        needle_offset = maximum_context_length
+    # cut the right context if necessary
+    if stop - start - needle_offset - span_length > maximum_context_length:
+        stop = start + needle_offset + span_length + maximum_context_length
+    display_length = stop - start
+    text = decoded_tokens.get_text(start, stop)
+    return display_length, needle_offset, text
+
+
+def get_attribution_document(
+    infini_gram_index: InfiniGramProcessor,
+    document: Document,
+    span_length: int,
+    maximum_context_length_long: int,
+    maximum_context_length_snippet: int,
+) -> AttributionDocument:
+    """Adds the long and snippet views of a document fetched for a span."""
+    # Documents are decoded once when they're fetched, the long and snippet views are slices of that
+    decoded_tokens = document.decoded_tokens
+    if decoded_tokens is None:
+        decoded_tokens = infini_gram_index.decode_tokens_with_offsets(
+            document.token_ids
+        )
+
+    display_length_long, needle_offset_long, text_long = cut_document(
+        decoded_tokens=decoded_tokens,
+        needle_offset=document.needle_offset,
+        span_length=span_length,
+        maximum_context_length=maximum_context_length_long,
+    )
+
+    display_length_snippet, needle_offset_snippet, text_snippet = cut_document(
+        decoded_tokens=decoded_tokens,
+        needle_offset=document.needle_offset,
+        span_length=span_length,
+        maximum_context_length=maximum_context_length_snippet,
+    )
+
+    return AttributionDocument(
+        **vars(document),
+        display_length_long=display_length_long,
+        needle_offset_long=needle_offset_long,
+        text_long=text_long,
+        display_offset_snippet=display_length_snippet,
+        needle_offset_snippet=needle_offset_snippet,
+        text_snippet=text_snippet,
+    )
@@ -0,0 +1,54 @@
+from typing import Iterable, NamedTuple, Protocol, Sequence
+
+from infini_gram.models import AttributionSpan as AttributionSpanFromEngine
+
+
+class AttributionSegment(NamedTuple):
+    start: int
+    stop: int
+
+
+class AttributionSegmentKey(NamedTuple):
+    infini_gram_index: str
+    token_ids: tuple[int, ...]
+    # Whether a span can end on the segment's last token depends on the token after it when spans have to end at word boundaries
+    next_token_id: int | None
+    delimiter_token_ids: tuple[int, ...]
+    minimum_span_length: int
+    maximum_frequency: int
+    enforce_bow: bool
+
+
+class AttributionSegmentCache(Protocol):
+    """Somewhere to keep each segment's spans, with their positions relative to the start of the segment."""
+
+    def get(
+        self, key: AttributionSegmentKey
+    ) -> list[AttributionSpanFromEngine] | None: ...
+
+    def set(
+        self, key: AttributionSegmentKey, value: list[AttributionSpanFromEngine]
+    ) -> None: ...
+
+
+def get_attribution_segments(
+    input_ids: Sequence[int], delimiter_token_ids: Iterable[int]
+) -> list[AttributionSegment]:
+    """
+    Splits the input after every delimiter token.
+
+    The engine never returns a span that continues past a delimiter, so attributing each segment along with the token after it and keeping the spans that start inside the segment gives the same spans as attributing the whole input.
+    """
+    delimiter_token_id_set = set(delimiter_token_ids)
+
+    segments: list[AttributionSegment] = []
+    start = 0
+    for position, token_id in enumerate(input_ids):
+        if token_id in delimiter_token_id_set:
+            segments.append(AttributionSegment(start, position + 1))
+            start = position + 1
+
+    if start < len(input_ids):
+        segments.append(AttributionSegment(start, len(input_ids)))
+
+    return segments
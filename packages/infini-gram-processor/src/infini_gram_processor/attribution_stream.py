@@ -0,0 +1,66 @@
+from pydantic import TypeAdapter
+
+from .models import (
+    AttributionDocument,
+    AttributionDocumentsEvent,
+    AttributionDoneEvent,
+    AttributionResponse,
+    AttributionSpan,
+    AttributionSpansEvent,
+    AttributionStreamEvent,
+    AttributionStreamSpan,
+)
+
+attribution_stream_event_adapter: TypeAdapter[AttributionStreamEvent] = TypeAdapter(
+    AttributionStreamEvent
+)
+
+
+def get_attribution_stream_events(
+    response: AttributionResponse,
+) -> list[AttributionStreamEvent]:
+    """Splits a finished response into the events a streamed attribution sends, for responses that didn't have to be streamed as they were made."""
+    events: list[AttributionStreamEvent] = [
+        AttributionSpansEvent(
+            index=response.index,
+            spans=[
+                AttributionStreamSpan(
+                    **span.model_dump(exclude={"documents"}),
+                )
+                for span in response.spans
+            ],
+            input_tokens=response.input_tokens or [],
+        )
+    ]
+    events.extend(get_attribution_documents_events(response))
+    events.append(AttributionDoneEvent())
+
+    return events
+
+
+def get_attribution_documents_events(
+    response: AttributionResponse,
+) -> list[AttributionDocumentsEvent]:
+    return [
+        AttributionDocumentsEvent(span_index=span_index, documents=span.documents)
+        for span_index, span in enumerate(response.spans)
+    ]
+
+
+def get_attribution_response_from_events(
+    spans_event: AttributionSpansEvent,
+    documents_events: list[AttributionDocumentsEvent],
+) -> AttributionResponse:
+    """Puts a streamed attribution's events back together into the response it would've been if it wasn't streamed."""
+    documents_by_span: list[list[AttributionDocument]] = [[] for _ in spans_event.spans]
+    for documents_event in documents_events:
+        documents_by_span[documents_event.span_index] = documents_event.documents
+
+    return AttributionResponse(
+        index=spans_event.index,
+        spans=[
+            AttributionSpan(**span.model_dump(), documents=documents)
+            for span, documents in zip(spans_event.spans, documents_by_span)
+        ],
+        input_tokens=spans_event.input_tokens,
+    )
@@ -0,0 +1,38 @@
+import argparse
+
+from infini_gram.engine import InfiniGramEngine
+
+from .tokenizers.tokenizer_factory import get_llama_2_tokenizer
+from .unigram_counts import (
+    get_shard_paths,
+    read_unigram_counts,
+    sum_unigram_counts,
+    write_unigram_counts,
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Build the unigram counts sidecar for infini-gram index directories"
+    )
+    parser.add_argument("index_dirs", nargs="+")
+    args = parser.parse_args()
+
+    eos_token_id = get_llama_2_tokenizer().eos_token_id
+
+    for index_dir in args.index_dirs:
+        if read_unigram_counts(index_dir) is not None:
+            print(f"{index_dir}: up to date")
+            continue
+
+        engine = InfiniGramEngine(index_dir=index_dir, eos_token_id=eos_token_id)
+        unigram_counts = sum_unigram_counts(
+            engine.compute_unigram_counts(s=shard)
+            for shard in range(len(get_shard_paths(index_dir)))
+        )
+
+        print(f"{index_dir}: wrote {write_unigram_counts(index_dir, unigram_counts)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+from enum import Enum
+
+from pydantic import BaseModel, ConfigDict
+
+from .index_mappings import AvailableInfiniGramIndexId
+from .processor_config import get_processor_config
+
+
+class EngineProfileName(Enum):
+    ATTRIBUTION = "attribution"
+    DOCUMENTS = "documents"
+
+
+class EngineProfile(BaseModel):
+    """The InfiniGramEngineDiff settings that trade latency for throughput depending on the workload."""
+
+    model_config = ConfigDict(frozen=True)
+
+    ds_prefetch_depth: int
+    sa_prefetch_depth: int
+    od_prefetch_depth: int
+    # We need to get the OSX build of infini-gram working again so we can upgrade it to 2.5.0
+    attribution_block_size: int = 256
+
+
+default_engine_profiles: dict[EngineProfileName, EngineProfile] = {
+    # Attribution does a lot of small independent lookups, disabling prefetching speeds it up
+    EngineProfileName.ATTRIBUTION: EngineProfile(
+        ds_prefetch_depth=0,
+        sa_prefetch_depth=0,
+        od_prefetch_depth=0,
+    ),
+    # Counting and paginated searches walk neighboring suffix array entries, so they benefit from the engine's default prefetching
+    EngineProfileName.DOCUMENTS: EngineProfile(
+        ds_prefetch_depth=1,
+        sa_prefetch_depth=3,
+        od_prefetch_depth=3,
+    ),
+}
+
+
+def get_engine_profile(
+    index: AvailableInfiniGramIndexId, profile_name: EngineProfileName
+) -> EngineProfile:
+    """Returns the default profile with any overrides from the ENGINE_PROFILES config applied."""
+    profile = default_engine_profiles[profile_name]
+
+    overrides = (
+        get_processor_config()
+        .engine_profiles.get(index.value, {})
+        .get(profile_name.value)
+    )
+    if overrides is None:
+        return profile
+
+    return EngineProfile.model_validate(profile.model_dump() | overrides)
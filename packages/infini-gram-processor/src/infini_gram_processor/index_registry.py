@@ -0,0 +1,91 @@
+import threading
+from collections import OrderedDict
+
+from opentelemetry import trace
+
+from .index_mappings import AvailableInfiniGramIndexId
+from .processor import InfiniGramProcessor
+from .processor_config import get_processor_config
+
+tracer = trace.get_tracer(__name__)
+
+
+class InfiniGramIndexRegistry:
+    """
+    Builds an InfiniGramProcessor the first time its index is requested and keeps at most `maximum_loaded_indexes` of them open, evicting the least recently used one when the budget is exceeded.
+    """
+
+    maximum_loaded_indexes: int | None
+
+    def __init__(self, maximum_loaded_indexes: int | None = None):
+        if maximum_loaded_indexes is not None and maximum_loaded_indexes < 1:
+            raise ValueError("maximum_loaded_indexes must be at least 1")
+
+        self.maximum_loaded_indexes = maximum_loaded_indexes
+        self._loaded: OrderedDict[AvailableInfiniGramIndexId, InfiniGramProcessor] = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self._load_locks = {
+            index: threading.Lock() for index in AvailableInfiniGramIndexId
+        }
+
+    def __getitem__(self, index: AvailableInfiniGramIndexId) -> InfiniGramProcessor:
+        processor = self._get_loaded(index)
+        if processor is not None:
+            return processor
+
+        # Loading an index can take a while, so only callers asking for the same index wait on each other
+        with self._load_locks[index]:
+            processor = self._get_loaded(index)
+            if processor is not None:
+                return processor
+
+            processor = self._load(index)
+
+            with self._lock:
+                self._loaded[index] = processor
+                self._evict_least_recently_used()
+
+            return processor
+
+    def __contains__(self, index: object) -> bool:
+        with self._lock:
+            return index in self._loaded
+
+    def loaded_indexes(self) -> list[AvailableInfiniGramIndexId]:
+        """Returns the currently loaded indexes, least recently used first."""
+        with self._lock:
+            return list(self._loaded.keys())
+
+    def evict(self, index: AvailableInfiniGramIndexId) -> None:
+        with self._lock:
+            self._loaded.pop(index, None)
+
+    def _get_loaded(
+        self, index: AvailableInfiniGramIndexId
+    ) -> InfiniGramProcessor | None:
+        with self._lock:
+            processor = self._loaded.get(index)
+            if processor is not None:
+                self._loaded.move_to_end(index)
+
+            return processor
+
+    @tracer.start_as_current_span("infini_gram_index_registry/load")
+    def _load(self, index: AvailableInfiniGramIndexId) -> InfiniGramProcessor:
+        trace.get_current_span().set_attribute("index", index.value)
+        return InfiniGramProcessor(index)
+
+    def _evict_least_recently_used(self) -> None:
+        if self.maximum_loaded_indexes is None:
+            return
+
+        # Requests already holding an evicted processor keep it alive until they finish
+        while len(self._loaded) > self.maximum_loaded_indexes:
+            self._loaded.popitem(last=False)
+
+
+indexes = InfiniGramIndexRegistry(
+    maximum_loaded_indexes=get_processor_config().maximum_loaded_indexes
+)
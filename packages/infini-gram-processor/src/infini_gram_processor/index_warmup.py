@@ -0,0 +1,203 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+from enum import StrEnum
+from functools import lru_cache
+from glob import glob
+from typing import Iterable
+
+from opentelemetry import trace
+
+from .index_mappings import AvailableInfiniGramIndexId, index_mappings
+from .processor_config import get_processor_config
+from .shard_pool import get_index_dirs
+
+tracer = trace.get_tracer(__name__)
+
+# Suffix arrays are binary searched on every query, token files are read while comparing against them, and offsets are read for every document we fetch
+_HOT_FILE_PATTERNS = ["table.*", "tokenized.*", "offset.*"]
+
+_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+class IndexWarmupMethod(StrEnum):
+    # Reads every chunk, works on any filesystem including gcsfuse
+    READ = "read"
+    # Asks the kernel to read chunks in the background, cheaper but some network filesystems ignore it
+    WILLNEED = "willneed"
+
+
+@dataclass
+class IndexWarmupProgress:
+    index: str
+    total_bytes: int
+    warmed_bytes: int = 0
+    done: bool = False
+    error: str | None = None
+
+
+class IndexWarmup:
+    """
+    Pulls the hottest files of each index into the page cache so the first requests against an index don't pay for cold reads off of network-backed disks.
+    """
+
+    method: IndexWarmupMethod
+    bandwidth_bytes_per_second: int | None
+    maximum_bytes_per_index: int | None
+
+    def __init__(
+        self,
+        indexes: Iterable[AvailableInfiniGramIndexId],
+        method: IndexWarmupMethod = IndexWarmupMethod.READ,
+        bandwidth_bytes_per_second: int | None = None,
+        maximum_bytes_per_index: int | None = None,
+    ):
+        self.method = method
+        self.bandwidth_bytes_per_second = bandwidth_bytes_per_second
+        self.maximum_bytes_per_index = maximum_bytes_per_index
+
+        self._files_by_index = {index: self._get_hot_files(index) for index in indexes}
+        self._progress = {
+            index: IndexWarmupProgress(
+                index=index.value,
+                total_bytes=sum(size for _, size in files),
+            )
+            for index, files in self._files_by_index.items()
+        }
+        self._lock = threading.Lock()
+        # A worker process runs a saq worker per index that each run the warmup on startup, the later ones wait for the first
+        self._run_lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._warmed_paths: set[str] = set()
+        self._throttle_started_at = 0.0
+        self._throttled_bytes = 0
+
+    def _get_hot_files(
+        self, index: AvailableInfiniGramIndexId
+    ) -> list[tuple[str, int]]:
+        index_mapping = index_mappings[index.value]
+        index_dirs = get_index_dirs(index_mapping["index_dir"]) + get_index_dirs(
+            index_mapping["index_dir_diff"]
+        )
+
+        files: list[tuple[str, int]] = []
+        total_bytes = 0
+        for pattern in _HOT_FILE_PATTERNS:
+            for index_dir in index_dirs:
+                for path in sorted(glob(os.path.join(index_dir, pattern))):
+                    size = os.path.getsize(path)
+                    if self.maximum_bytes_per_index is not None:
+                        size = min(size, self.maximum_bytes_per_index - total_bytes)
+                        if size <= 0:
+                            return files
+
+                    files.append((os.path.realpath(path), size))
+                    total_bytes += size
+
+        return files
+
+    def start(self) -> None:
+        """Warms every index on a background thread."""
+        with self._lock:
+            if self._thread is not None:
+                return
+
+            self._thread = threading.Thread(
+                target=self.run, name="index-warmup", daemon=True
+            )
+            self._thread.start()
+
+    def run(self) -> None:
+        with self._run_lock:
+            self._run()
+
+    def _run(self) -> None:
+        # Forked worker processes inherit a warmup their supervisor already ran
+        if self.is_ready():
+            return
+
+        self._throttle_started_at = time.monotonic()
+        self._throttled_bytes = 0
+
+        for index, files in self._files_by_index.items():
+            progress = self._progress[index]
+            # Later runs only retry the indexes that errored
+            if progress.done:
+                continue
+
+            progress.warmed_bytes = 0
+            progress.error = None
+            with tracer.start_as_current_span(
+                "index_warmup/warm_index", attributes={"index": index.value}
+            ):
+                try:
+                    for path, size in files:
+                        self._warm_file(path, size, progress)
+                except OSError as e:
+                    # An index that couldn't be warmed isn't done, so it isn't reported ready with cold files
+                    progress.error = str(e)
+                    continue
+
+            progress.done = True
+
+    def _warm_file(self, path: str, size: int, progress: IndexWarmupProgress) -> None:
+        # Indexes share shard directories, so only the first index to reach a file reads it
+        if path in self._warmed_paths:
+            progress.warmed_bytes += size
+            return
+
+        with open(path, "rb", buffering=0) as file:
+            offset = 0
+            while offset < size:
+                chunk_size = min(_CHUNK_SIZE, size - offset)
+
+                if self.method == IndexWarmupMethod.WILLNEED:
+                    os.posix_fadvise(
+                        file.fileno(), offset, chunk_size, os.POSIX_FADV_WILLNEED
+                    )
+                else:
+                    file.seek(offset)
+                    file.read(chunk_size)
+
+                offset += chunk_size
+                progress.warmed_bytes += chunk_size
+                self._throttle(chunk_size)
+
+        self._warmed_paths.add(path)
+
+    def _throttle(self, chunk_size: int) -> None:
+        if self.bandwidth_bytes_per_second is None:
+            return
+
+        self._throttled_bytes += chunk_size
+        earliest_finish = self._throttle_started_at + (
+            self._throttled_bytes / self.bandwidth_bytes_per_second
+        )
+        delay = earliest_finish - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def is_ready(self) -> bool:
+        return all(progress.done for progress in self._progress.values())
+
+    def get_progress(self) -> list[IndexWarmupProgress]:
+        return list(self._progress.values())
+
+
+@lru_cache
+def get_index_warmup() -> IndexWarmup:
+    config = get_processor_config()
+
+    warmup_indexes = (
+        [AvailableInfiniGramIndexId(index) for index in config.warmup_indexes]
+        if config.warmup_indexes is not None
+        else list(AvailableInfiniGramIndexId)
+    )
+
+    return IndexWarmup(
+        indexes=warmup_indexes if config.warmup_enabled else [],
+        method=IndexWarmupMethod(config.warmup_method),
+        bandwidth_bytes_per_second=config.warmup_bandwidth_bytes_per_second,
+        maximum_bytes_per_index=config.warmup_maximum_bytes_per_index,
+    )
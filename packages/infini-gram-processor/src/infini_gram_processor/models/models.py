@@ -1,5 +1,5 @@
 from enum import StrEnum
-from typing import Any, Optional, Sequence
+from typing import Annotated, Any, Literal, Optional, Sequence, Union
 
 from infini_gram.models import (
     AttributionDoc,
@@ -7,8 +7,9 @@ from infini_gram.models import (
 from infini_gram.models import (
     AttributionSpan as AttributionSpanFromEngine,
 )
-from pydantic import BaseModel, Field
+from pydantic import AliasChoices, BaseModel, Field, PrivateAttr
 
+from ..tokenizers.decoded_tokens import DecodedTokens
 from .camel_case_model import CamelCaseModel
 
 
@@ -50,19 +51,58 @@ class InfiniGramCountResponse(BaseInfiniGramResponse):
 
 
 class Document(CamelCaseModel):
-    document_index: int = Field(validation_alias="doc_ix")
-    document_length: int = Field(validation_alias="doc_len")
-    display_length: int = Field(validation_alias="disp_len")
-    needle_offset: int = Field(validation_alias="needle_offset")
+    # Documents are validated from the engine's results and from our own serialized responses
+    document_index: int = Field(
+        validation_alias=AliasChoices("doc_ix", "documentIndex")
+    )
+    document_length: int = Field(
+        validation_alias=AliasChoices("doc_len", "documentLength")
+    )
+    display_length: int = Field(
+        validation_alias=AliasChoices("disp_len", "displayLength")
+    )
+    needle_offset: int = Field(
+        validation_alias=AliasChoices("needle_offset", "needleOffset")
+    )
     metadata: dict[str, Any]
     token_ids: list[int]
     text: str
     blocked: bool = False
+    # Lets callers get the text of parts of the document without decoding it again. Only set on documents fetched by pointer
+    _decoded_tokens: DecodedTokens | None = PrivateAttr(default=None)
+
+    @property
+    def decoded_tokens(self) -> DecodedTokens | None:
+        return self._decoded_tokens
+
+    def get_window(self, start: int, stop: int, needle_offset: int) -> "Document":
+        """
+        Returns the part of this document in `token_ids[start:stop]` for a needle at `needle_offset` in `token_ids`.
+
+        Only works on documents that have their decoded tokens.
+        """
+        if self._decoded_tokens is None:
+            raise ValueError("Only documents with decoded tokens can be windowed")
+
+        decoded_window = self._decoded_tokens.get_range(start, stop)
+        window = Document(
+            document_index=self.document_index,
+            document_length=self.document_length,
+            display_length=len(decoded_window.token_ids),
+            needle_offset=needle_offset - start,
+            metadata=self.metadata,
+            token_ids=list(decoded_window.token_ids),
+            text=decoded_window.text,
+            blocked=self.blocked,
+        )
+        window._decoded_tokens = decoded_window
+        return window
 
 
 class InfiniGramAttributionResponse(BaseInfiniGramResponse):
     spans: list[AttributionSpanFromEngine]
     input_token_ids: list[int]
+    input_tokens: Sequence[str]
 
 
 class InfiniGramSearchResponse(CamelCaseModel):
@@ -79,6 +119,13 @@ class AttributionDocument(Document):
     text_snippet: str
 
 
+class AttributionDocumentHandle(CamelCaseModel):
+    """Where a span was found in the index, so its document can be fetched later instead of with the attribution."""
+
+    shard: int
+    pointer: int
+
+
 class AttributionSpan(CamelCaseModel):
     left: int
     right: int
@@ -88,6 +135,8 @@ class AttributionSpan(CamelCaseModel):
     text: str
     token_ids: Sequence[int]
     documents: list[AttributionDocument]
+    # Only set when documents weren't fetched with the attribution
+    document_handles: list[AttributionDocumentHandle] = []
 
 
 class AttributionResponse(BaseInfiniGramResponse):
@@ -95,3 +144,49 @@ class AttributionResponse(BaseInfiniGramResponse):
     input_tokens: Optional[Sequence[str]] = Field(
         examples=[["busy", " medieval", " streets", "."]]
     )
+
+
+class AttributionStreamSpan(CamelCaseModel):
+    left: int
+    right: int
+    length: int
+    count: int
+    unigram_logprob_sum: float
+    text: str
+    token_ids: Sequence[int]
+    document_handles: list[AttributionDocumentHandle] = []
+
+
+class AttributionSpansEvent(CamelCaseModel):
+    type: Literal["spans"] = "spans"
+    index: str
+    spans: Sequence[AttributionStreamSpan]
+    input_tokens: Sequence[str]
+
+
+class AttributionDocumentsEvent(CamelCaseModel):
+    type: Literal["documents"] = "documents"
+    # The span's position in the spans event
+    span_index: int
+    documents: list[AttributionDocument]
+
+
+class AttributionDoneEvent(CamelCaseModel):
+    type: Literal["done"] = "done"
+
+
+class AttributionErrorEvent(CamelCaseModel):
+    type: Literal["error"] = "error"
+    detail: str
+
+
+# A streamed attribution sends its spans as soon as they're found, then each span's documents, then a done or error event
+AttributionStreamEvent = Annotated[
+    Union[
+        AttributionSpansEvent,
+        AttributionDocumentsEvent,
+        AttributionDoneEvent,
+        AttributionErrorEvent,
+    ],
+    Field(discriminator="type"),
+]
@@ -1,4 +1,5 @@
 import json
+import threading
 from typing import (
     Iterable,
     Sequence,
@@ -6,6 +7,9 @@ from typing import (
 )
 
 from infini_gram.engine import InfiniGramEngineDiff
+from infini_gram.models import (
+    AttributionSpan as AttributionSpanFromEngine,
+)
 from infini_gram.models import (
     InfiniGramEngineResponse,
 )
@@ -16,6 +20,12 @@ from transformers.tokenization_utils_base import (  # type: ignore
     TextInput,
 )
 
+from .attribution_segments import (
+    AttributionSegmentCache,
+    AttributionSegmentKey,
+    get_attribution_segments,
+)
+from .engine_profiles import EngineProfile, EngineProfileName, get_engine_profile
 from .index_mappings import AvailableInfiniGramIndexId, index_mappings
 from .infini_gram_engine_exception import InfiniGramEngineException
 from .models import (
@@ -31,7 +41,9 @@ from .models.is_infini_gram_error_response import (
     TInfiniGramResponse,
     is_infini_gram_error_response,
 )
-from .tokenizers.tokenizer import Tokenizer
+from .shard_pool import get_index_dirs, shard_pool
+from .tokenizers.decoded_tokens import DecodedTokens
+from .tokenizers.tokenizer import EncodedText, Tokenizer
 
 tracer = trace.get_tracer(__name__)
 
@@ -39,26 +51,66 @@ tracer = trace.get_tracer(__name__)
 class InfiniGramProcessor:
     index: str
     tokenizer: Tokenizer
+    # Engine tuned for attribution and the pointer lookups that follow it
     infini_gram_engine: InfiniGramEngineDiff
+    unigram_logprobs: Sequence[float]
+    # Documents can be blocked by the diff index depending on the span that found them
+    has_index_diff: bool
 
     def __init__(self, index: AvailableInfiniGramIndexId):
         self.index = index.value
-        index_mapping = index_mappings[index.value]
+        self.__index_mapping = index_mappings[index.value]
+
+        self.tokenizer = self.__index_mapping["tokenizer"]
+        self.has_index_diff = (
+            len(get_index_dirs(self.__index_mapping["index_dir_diff"])) > 0
+        )
+
+        self.__engine_profiles = {
+            profile_name: get_engine_profile(index, profile_name)
+            for profile_name in EngineProfileName
+        }
+        self.__engines_by_profile: dict[EngineProfile, InfiniGramEngineDiff] = {}
+        self.__engines_lock = threading.Lock()
 
-        self.tokenizer = index_mapping["tokenizer"]
+        self.infini_gram_engine = self.__get_engine(EngineProfileName.ATTRIBUTION)
+
+        self.unigram_logprobs = shard_pool.get_unigram_logprobs(
+            index_dirs=get_index_dirs(self.__index_mapping["index_dir"]),
+            num_shards=self.infini_gram_engine.engine.get_num_shards(),
+            compute_unigram_counts=self.__compute_unigram_counts,
+        )
 
-        self.infini_gram_engine = InfiniGramEngineDiff(
-            index_dir=index_mapping["index_dir"],
-            index_dir_diff=index_mapping["index_dir_diff"],
+    @property
+    def document_engine(self) -> InfiniGramEngineDiff:
+        """Engine tuned for counting, searching and fetching documents by rank or index."""
+        return self.__get_engine(EngineProfileName.DOCUMENTS)
+
+    def __get_engine(self, profile_name: EngineProfileName) -> InfiniGramEngineDiff:
+        profile = self.__engine_profiles[profile_name]
+
+        # Engines are built the first time a profile is used so the worker, which only attributes, never builds a document engine. Profiles with the same settings share an engine
+        with self.__engines_lock:
+            engine = self.__engines_by_profile.get(profile)
+            if engine is None:
+                engine = self.__create_engine(profile)
+                self.__engines_by_profile[profile] = engine
+
+            return engine
+
+    @tracer.start_as_current_span("infini_gram_processor/create_engine")
+    def __create_engine(self, profile: EngineProfile) -> InfiniGramEngineDiff:
+        return InfiniGramEngineDiff(
+            index_dir=self.__index_mapping["index_dir"],
+            index_dir_diff=self.__index_mapping["index_dir_diff"],
             eos_token_id=self.tokenizer.eos_token_id,
             bow_ids_path=self.tokenizer.bow_ids_path,
-            # We need to get the OSX build of infini-gram working again so we can upgrade it to 2.5.0
-            attribution_block_size=256,
-            precompute_unigram_logprobs=True,
-            # for the attribution feature, disabling prefetching can speed things up
-            ds_prefetch_depth=0,
-            sa_prefetch_depth=0,
-            od_prefetch_depth=0,
+            attribution_block_size=profile.attribution_block_size,
+            # Unigram logprobs come from the shard pool so shards shared between indexes are only counted once
+            precompute_unigram_logprobs=False,
+            ds_prefetch_depth=profile.ds_prefetch_depth,
+            sa_prefetch_depth=profile.sa_prefetch_depth,
+            od_prefetch_depth=profile.od_prefetch_depth,
         )
 
     @tracer.start_as_current_span("infini_gram_processor/tokenize")
@@ -67,14 +119,45 @@ class InfiniGramProcessor:
     ) -> list[int]:
         return self.tokenizer.tokenize(input)
 
+    @tracer.start_as_current_span("infini_gram_processor/encode")
+    def encode(self, input: TextInput) -> EncodedText:
+        return self.tokenizer.encode(input)
+
+    @tracer.start_as_current_span("infini_gram_processor/batch_encode")
+    def batch_encode(self, inputs: Sequence[TextInput]) -> list[EncodedText]:
+        return self.tokenizer.batch_encode(inputs)
+
     @tracer.start_as_current_span("infini_gram_processor/decode_tokens")
     def decode_tokens(self, token_ids: Iterable[int]) -> str:
         return self.tokenizer.decode_tokens(token_ids)
 
+    def decode_tokens_with_offsets(self, token_ids: Sequence[int]) -> DecodedTokens:
+        return self.tokenizer.decode_tokens_with_offsets(token_ids)
+
+    @tracer.start_as_current_span("infini_gram_processor/batch_decode_tokens")
+    def batch_decode_tokens(
+        self, token_ids_batch: Sequence[Sequence[int]]
+    ) -> list[str]:
+        return self.tokenizer.batch_decode_tokens(token_ids_batch)
+
+    @tracer.start_as_current_span(
+        "infini_gram_processor/batch_decode_tokens_with_offsets"
+    )
+    def batch_decode_tokens_with_offsets(
+        self, token_ids_batch: Sequence[Sequence[int]]
+    ) -> list[DecodedTokens]:
+        return self.tokenizer.batch_decode_tokens_with_offsets(token_ids_batch)
+
     @tracer.start_as_current_span("infini_gram_processor/tokenize_to_list")
     def tokenize_to_list(self, input: TextInput) -> Sequence[str]:
         return self.tokenizer.tokenize_to_list(input)
 
+    def __compute_unigram_counts(self, shard: int) -> list[int]:
+        return self.infini_gram_engine.compute_unigram_counts(s=shard)
+
+    def __get_unigram_logprob_sum(self, token_ids: Iterable[int]) -> float:
+        return sum(self.unigram_logprobs[token_id] for token_id in token_ids)
+
     def __handle_error(
         self,
         result: InfiniGramEngineResponse[TInfiniGramResponse],
@@ -88,7 +171,7 @@ class InfiniGramProcessor:
     def count_n_gram(self, query: str) -> InfiniGramCountResponse:
         tokenized_query_ids = self.tokenize(query)
 
-        count_response = self.infini_gram_engine.count(input_ids=tokenized_query_ids)
+        count_response = self.document_engine.count(input_ids=tokenized_query_ids)
 
         count_result = self.__handle_error(count_response)
 
@@ -98,7 +181,7 @@ class InfiniGramProcessor:
     def get_document_by_rank(
         self, shard: int, rank: int, needle_length: int, maximum_context_length: int
     ) -> Document:
-        get_doc_by_rank_response = self.infini_gram_engine.get_doc_by_rank_2(
+        get_doc_by_rank_response = self.document_engine.get_doc_by_rank_2(
             s=shard,
             rank=rank,
             needle_len=needle_length,
@@ -125,7 +208,7 @@ class InfiniGramProcessor:
         self,
         document_requests: Iterable[GetDocumentByRankRequest],
     ) -> list[Document]:
-        get_docs_by_ranks_response = self.infini_gram_engine.get_docs_by_ranks_2(
+        get_docs_by_ranks_response = self.document_engine.get_docs_by_ranks_2(
             requests=[
                 (
                     document_request.shard,
@@ -139,10 +222,13 @@ class InfiniGramProcessor:
 
         document_results = self.__handle_error(get_docs_by_ranks_response)
 
+        decoded_texts = self.batch_decode_tokens(
+            [document_result["token_ids"] for document_result in document_results]
+        )
+
         documents = []
-        for document_result in document_results:
+        for document_result, decoded_text in zip(document_results, decoded_texts):
             parsed_metadata = json.loads(document_result["metadata"])
-            decoded_text = self.decode_tokens(document_result["token_ids"])
 
             documents.append(
                 Document(
@@ -203,28 +289,45 @@ class InfiniGramProcessor:
 
         documents_by_span_result = self.__handle_error(get_docs_by_pointers_response)
 
-        return [
-            [
-                Document(
+        # Decode the documents of every span together
+        decoded_tokens_by_document = iter(
+            self.batch_decode_tokens_with_offsets(
+                [
+                    document_result["token_ids"]
+                    for documents_result in documents_by_span_result
+                    for document_result in documents_result
+                ]
+            )
+        )
+
+        documents_by_span: list[list[Document]] = []
+        for documents_result in documents_by_span_result:
+            documents: list[Document] = []
+            for document_result in documents_result:
+                decoded_tokens = next(decoded_tokens_by_document)
+
+                document = Document(
                     document_index=document_result["doc_ix"],
                     document_length=document_result["doc_len"],
                     display_length=document_result["disp_len"],
                     needle_offset=document_result["needle_offset"],
                     metadata=json.loads(document_result["metadata"]),
                     token_ids=document_result["token_ids"],
-                    text=self.decode_tokens(document_result["token_ids"]),
+                    text=decoded_tokens.text,
                     blocked=document_result["blocked"],
                 )
-                for document_result in documents_result
-            ]
-            for documents_result in documents_by_span_result
-        ]
+                document._decoded_tokens = decoded_tokens
+                documents.append(document)
+
+            documents_by_span.append(documents)
+
+        return documents_by_span
 
     @tracer.start_as_current_span("infini_gram_processor/get_document_by_index")
     def get_document_by_index(
         self, document_index: int, maximum_context_length: int
     ) -> Document:
-        get_doc_by_index_response = self.infini_gram_engine.get_doc_by_ix_2(
+        get_doc_by_index_response = self.document_engine.get_doc_by_ix_2(
             doc_ix=document_index,
             max_ctx_len=maximum_context_length,
         )
@@ -248,7 +351,7 @@ class InfiniGramProcessor:
     def get_documents_by_indexes(
         self, document_requests: Iterable[GetDocumentByIndexRequest]
     ) -> list[Document]:
-        get_docs_by_indexes_response = self.infini_gram_engine.get_docs_by_ixs_2(
+        get_docs_by_indexes_response = self.document_engine.get_docs_by_ixs_2(
             requests=[
                 (
                     document_request.document_index,
@@ -260,10 +363,13 @@ class InfiniGramProcessor:
 
         document_results = self.__handle_error(get_docs_by_indexes_response)
 
+        decoded_texts = self.batch_decode_tokens(
+            [document_result["token_ids"] for document_result in document_results]
+        )
+
         documents = []
-        for document_result in document_results:
+        for document_result, decoded_text in zip(document_results, decoded_texts):
             parsed_metadata = json.loads(document_result["metadata"])
-            decoded_text = self.decode_tokens(document_result["token_ids"])
 
             documents.append(
                 Document(
@@ -288,7 +394,7 @@ class InfiniGramProcessor:
         page_size: int,
     ) -> InfiniGramSearchResponse:
         tokenized_query_ids = self.tokenize(search)
-        matching_documents = self.infini_gram_engine.find(input_ids=tokenized_query_ids)
+        matching_documents = self.document_engine.find(input_ids=tokenized_query_ids)
 
         matching_documents_result = self.__handle_error(matching_documents)
 
@@ -345,26 +451,173 @@ class InfiniGramProcessor:
         allow_spans_with_partial_words: bool,
         minimum_span_length: int,
         maximum_frequency: int,
+        encoded_input: EncodedText | None = None,
+        segment_cache: AttributionSegmentCache | None = None,
+        previous_attribute_result: InfiniGramAttributionResponse | None = None,
     ) -> InfiniGramAttributionResponse:
-        input_ids = self.tokenize(input)
+        """
+        Finds the spans of `input` that appear in the index.
+
+        `previous_attribute_result` can be the result of attributing an earlier version of `input` with the same parameters, like a model's response before its latest tokens were generated. The spans it has that can't have changed are reused and only the rest of the input goes to the engine.
+        """
+        # Tokenize once and keep the offsets so the response can include the input's tokens without re-tokenizing it. Callers attributing several inputs can batch-encode them and pass the result in
+        if encoded_input is None:
+            encoded_input = self.encode(input)
+        input_ids = encoded_input.token_ids
 
         delimiter_token_ids = self.tokenizer.tokenize_attribution_delimiters(delimiters)
+        enforce_bow = not allow_spans_with_partial_words
+
+        anchor = 0
+        if previous_attribute_result is not None:
+            anchor = self.__get_incremental_anchor(
+                previous_input_ids=previous_attribute_result.input_token_ids,
+                input_ids=input_ids,
+                enforce_bow=enforce_bow,
+            )
+            trace.get_current_span().set_attribute("incremental_anchor", anchor)
+
+        tail_ids = input_ids[anchor:]
+        if segment_cache is None:
+            attribute_response = self.infini_gram_engine.attribute(
+                input_ids=tail_ids,
+                delim_ids=delimiter_token_ids,
+                min_len=minimum_span_length,
+                max_cnt=maximum_frequency,
+                enforce_bow=enforce_bow,
+            )
+            tail_spans = self.__handle_error(attribute_response)["spans"]
+        else:
+            tail_spans = self.__attribute_segments(
+                input_ids=tail_ids,
+                delimiter_token_ids=delimiter_token_ids,
+                minimum_span_length=minimum_span_length,
+                maximum_frequency=maximum_frequency,
+                enforce_bow=enforce_bow,
+                segment_cache=segment_cache,
+            )
 
-        attribute_response = self.infini_gram_engine.attribute(
-            input_ids=input_ids,
-            delim_ids=delimiter_token_ids,
-            min_len=minimum_span_length,
-            max_cnt=maximum_frequency,
-            enforce_bow=not allow_spans_with_partial_words,
-        )
+        for span in tail_spans:
+            span["unigram_logprob_sum"] = self.__get_unigram_logprob_sum(
+                tail_ids[span["l"] : span["r"]]
+            )
 
-        attribute_result = self.__handle_error(attribute_response)
+        if previous_attribute_result is None or anchor == 0:
+            spans = tail_spans
+        else:
+            # The previous result decides the span starting at the anchor, the engine only saw the input from the anchor on so it couldn't tell whether an earlier span covers it
+            spans = [
+                span for span in previous_attribute_result.spans if span["l"] <= anchor
+            ] + [
+                {**span, "l": span["l"] + anchor, "r": span["r"] + anchor}
+                for span in tail_spans
+                if span["l"] > 0
+            ]
 
         return InfiniGramAttributionResponse(
-            **attribute_result,
+            spans=spans,
             index=self.index,
             input_token_ids=input_ids,
+            input_tokens=self.tokenizer.get_token_texts(input, encoded_input),
         )
 
+    def __get_incremental_anchor(
+        self,
+        previous_input_ids: list[int],
+        input_ids: list[int],
+        enforce_bow: bool,
+    ) -> int:
+        # Whether a document is blocked by the diff index depends on the span, so counts can't tell us which spans are safe to reuse
+        if self.has_index_diff:
+            return 0
+
+        common_length = 0
+        for previous_token_id, token_id in zip(previous_input_ids, input_ids):
+            if previous_token_id != token_id:
+                break
+            common_length += 1
+
+        # Spans are matches against the index, so once the tokens from a position up to the first changed token aren't in the index no span starting there or earlier can reach the change
+        unseen_length = 1
+        while unseen_length <= common_length:
+            count_response = self.infini_gram_engine.count(
+                input_ids=input_ids[common_length - unseen_length : common_length]
+            )
+            if self.__handle_error(count_response)["count"] == 0:
+                anchor = common_length - unseen_length
+                # Spans that have to be whole words can only start on a word, and the anchor's span is taken from the previous result
+                while (
+                    enforce_bow
+                    and anchor > 0
+                    and input_ids[anchor] not in self.tokenizer.bow_ids
+                ):
+                    anchor -= 1
+
+                return anchor
+
+            unseen_length *= 2
+
+        return 0
+
+    def __attribute_segments(
+        self,
+        input_ids: list[int],
+        delimiter_token_ids: list[int],
+        minimum_span_length: int,
+        maximum_frequency: int,
+        enforce_bow: bool,
+        segment_cache: AttributionSegmentCache,
+    ) -> list[AttributionSpanFromEngine]:
+        # Responses often repeat sentences, so attributing delimiter-separated segments on their own lets those sentences be looked up in the cache
+        spans: list[AttributionSpanFromEngine] = []
+        segment_cache_hits = 0
+
+        segments = get_attribution_segments(input_ids, delimiter_token_ids)
+        for segment in segments:
+            segment_key = AttributionSegmentKey(
+                infini_gram_index=self.index,
+                token_ids=tuple(input_ids[segment.start : segment.stop]),
+                next_token_id=input_ids[segment.stop]
+                if segment.stop < len(input_ids)
+                else None,
+                delimiter_token_ids=tuple(delimiter_token_ids),
+                minimum_span_length=minimum_span_length,
+                maximum_frequency=maximum_frequency,
+                enforce_bow=enforce_bow,
+            )
+
+            segment_spans = segment_cache.get(segment_key)
+            if segment_spans is None:
+                attribute_response = self.infini_gram_engine.attribute(
+                    input_ids=input_ids[segment.start : segment.stop + 1],
+                    delim_ids=delimiter_token_ids,
+                    min_len=minimum_span_length,
+                    max_cnt=maximum_frequency,
+                    enforce_bow=enforce_bow,
+                )
+                # Spans starting on the token after the segment belong to the next segment
+                segment_spans = [
+                    span
+                    for span in self.__handle_error(attribute_response)["spans"]
+                    if span["l"] < segment.stop - segment.start
+                ]
+                segment_cache.set(segment_key, segment_spans)
+            else:
+                segment_cache_hits += 1
+
+            # Cached spans are shared, so the input's spans are copies moved to where the segment starts
+            spans.extend(
+                {
+                    **span,
+                    "l": span["l"] + segment.start,
+                    "r": span["r"] + segment.start,
+                }
+                for span in segment_spans
+            )
+
+        current_span = trace.get_current_span()
+        current_span.set_attributes(
+            {"segments": len(segments), "segment_cache_hits": segment_cache_hits}
+        )
 
-indexes = {index: InfiniGramProcessor(index) for index in AvailableInfiniGramIndexId}
+        return spans
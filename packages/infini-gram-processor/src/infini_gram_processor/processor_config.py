@@ -6,6 +6,21 @@ class ProcessorConfig(BaseSettings):
 
     index_base_path: str = "/mnt/infinigram-array"
     vendor_base_path: str = "/app/vendor"
+    # Unset means every index that gets requested stays loaded
+    maximum_loaded_indexes: int | None = None
+    # Where to keep unigram counts sidecar files, unset means next to the index's shards
+    unigram_counts_dir: str | None = None
+
+    # Pre-reads the hottest index files into the page cache on startup, see index_warmup.py
+    warmup_enabled: bool = False
+    # Unset means every index
+    warmup_indexes: list[str] | None = None
+    warmup_method: str = "read"
+    warmup_bandwidth_bytes_per_second: int | None = None
+    warmup_maximum_bytes_per_index: int | None = None
+
+    # Per-index overrides for engine profile settings, e.g. {"pileval-llama": {"documents": {"sa_prefetch_depth": 5}}}. See engine_profiles.py for the defaults
+    engine_profiles: dict[str, dict[str, dict[str, int]]] = {}
 
 
 tokenizer_config = ProcessorConfig()
@@ -0,0 +1,126 @@
+import math
+import os
+import threading
+from array import array
+from typing import Callable, Iterable, Sequence
+
+from opentelemetry import trace
+
+from .unigram_counts import (
+    get_shard_paths,
+    read_unigram_counts,
+    sum_unigram_counts,
+    write_unigram_counts,
+)
+
+tracer = trace.get_tracer(__name__)
+
+_MISSING_UNIGRAM_LOGPROB = -10_000.0
+
+
+def get_index_dirs(index_dir: str | Iterable[str]) -> list[str]:
+    if isinstance(index_dir, str):
+        return [index_dir]
+
+    return list(index_dir)
+
+
+class InfiniGramShardPool:
+    """
+    Keeps data that doesn't depend on which index a set of shards belongs to, keyed by the shards' index directory.
+
+    Several indexes list the same pretraining directories (e.g. olmoe-mix-0924-dclm), so anything we compute from their shards is done once per process and shared by every index that uses them.
+    """
+
+    def __init__(self) -> None:
+        self._unigram_counts: dict[str, Sequence[int]] = {}
+        self._lock = threading.Lock()
+        self._index_dir_locks: dict[str, threading.Lock] = {}
+
+    def _get_index_dir_key(self, index_dir: str) -> str:
+        return os.path.realpath(index_dir)
+
+    def _get_index_dir_lock(self, index_dir_key: str) -> threading.Lock:
+        with self._lock:
+            return self._index_dir_locks.setdefault(index_dir_key, threading.Lock())
+
+    def get_unigram_counts(
+        self,
+        index_dir: str,
+        shards: Sequence[int],
+        compute_unigram_counts: Callable[[int], Sequence[int]],
+    ) -> Sequence[int]:
+        """
+        Returns the unigram counts summed over every shard in `index_dir`.
+
+        Counts come from the pool, then from the directory's unigram counts sidecar file. `compute_unigram_counts` is called with the engine's shard numbers for this directory only if neither has them, and we try to save the result as a sidecar.
+        """
+        index_dir_key = self._get_index_dir_key(index_dir)
+
+        with self._get_index_dir_lock(index_dir_key):
+            unigram_counts = self._unigram_counts.get(index_dir_key)
+            if unigram_counts is None:
+                unigram_counts = read_unigram_counts(index_dir)
+
+            if unigram_counts is None:
+                with tracer.start_as_current_span(
+                    "infini_gram_shard_pool/compute_unigram_counts",
+                    attributes={"index_dir": index_dir_key},
+                ):
+                    unigram_counts = sum_unigram_counts(
+                        compute_unigram_counts(shard) for shard in shards
+                    )
+
+                try:
+                    write_unigram_counts(index_dir, unigram_counts)
+                except OSError:
+                    # Index directories are usually mounted read-only, the build step is what normally writes these
+                    pass
+
+            self._unigram_counts[index_dir_key] = unigram_counts
+
+            return unigram_counts
+
+    def get_unigram_logprobs(
+        self,
+        index_dirs: Sequence[str],
+        num_shards: int,
+        compute_unigram_counts: Callable[[int], Sequence[int]],
+    ) -> Sequence[float]:
+        """
+        Builds the unigram log-probability table for an index made of `index_dirs`.
+
+        The engine numbers shards directory by directory, so each directory owns a contiguous range of shard numbers.
+        """
+        counts_by_index_dir: list[Sequence[int]] = []
+        shard_offset = 0
+        for index_dir in index_dirs:
+            shard_count = len(get_shard_paths(index_dir))
+            counts_by_index_dir.append(
+                self.get_unigram_counts(
+                    index_dir,
+                    shards=range(shard_offset, shard_offset + shard_count),
+                    compute_unigram_counts=compute_unigram_counts,
+                )
+            )
+            shard_offset += shard_count
+
+        if shard_offset != num_shards:
+            raise ValueError(
+                f"Found {shard_offset} shards in {index_dirs} but the engine loaded {num_shards}"
+            )
+
+        total_counts = sum_unigram_counts(counts_by_index_dir)
+        total_count = sum(total_counts)
+
+        # Matches the table the engine builds with precompute_unigram_logprobs=True
+        return array(
+            "d",
+            (
+                math.log(count / total_count) if count > 0 else _MISSING_UNIGRAM_LOGPROB
+                for count in total_counts
+            ),
+        )
+
+
+shard_pool = InfiniGramShardPool()
@@ -0,0 +1,124 @@
+import json
+import re
+from copy import copy
+from itertools import accumulate
+from typing import Callable, Sequence
+
+from transformers import (  # type: ignore
+    PreTrainedTokenizer,
+    PreTrainedTokenizerFast,
+)
+
+# The decoder SentencePiece tokenizers like llama's use: "▁" is a space, <0x..> tokens are raw bytes, and the first leading space is stripped
+_SENTENCEPIECE_BYTE_FALLBACK_DECODER = {
+    "type": "Sequence",
+    "decoders": [
+        {"type": "Replace", "pattern": {"String": "▁"}, "content": " "},
+        {"type": "ByteFallback"},
+        {"type": "Fuse"},
+        {"type": "Strip", "content": " ", "start": 1, "stop": 0},
+    ],
+}
+
+_BYTE_TOKEN = re.compile(r"<0x([0-9A-F]{2})>")
+
+
+def get_token_bytes_table(
+    hf_tokenizer: PreTrainedTokenizer | PreTrainedTokenizerFast,
+) -> list[bytes] | None:
+    """
+    Returns the bytes every token id decodes to, or None if the tokenizer's decoder isn't one we know how to replicate.
+    """
+    if not isinstance(hf_tokenizer, PreTrainedTokenizerFast):
+        return None
+
+    decoder = json.loads(hf_tokenizer.backend_tokenizer.to_str()).get("decoder")  # pyright: ignore[reportUnknownMemberType]
+    if decoder != _SENTENCEPIECE_BYTE_FALLBACK_DECODER:
+        return None
+
+    pieces: list[str] = hf_tokenizer.convert_ids_to_tokens(  # pyright: ignore[reportUnknownMemberType]
+        list(range(len(hf_tokenizer)))
+    )
+
+    token_bytes_table: list[bytes] = []
+    for piece in pieces:
+        byte_token = _BYTE_TOKEN.fullmatch(piece)
+        token_bytes_table.append(
+            bytes([int(byte_token.group(1), 16)])
+            if byte_token is not None
+            else piece.replace("▁", " ").encode()
+        )
+
+    return token_bytes_table
+
+
+class DecodedTokens:
+    """
+    A sequence of token ids decoded once, that can return the text of any range of its tokens without detokenizing again.
+
+    Text for a range is the same as decoding just that range's tokens.
+    """
+
+    token_ids: Sequence[int]
+    text: str
+
+    def __init__(
+        self,
+        token_ids: Sequence[int],
+        token_bytes_table: list[bytes] | None,
+        decode: Callable[[Sequence[int]], str],
+        text: str | None = None,
+    ):
+        self.token_ids = token_ids
+        self._decode = decode
+
+        if token_bytes_table is None:
+            self._bytes = None
+            self._byte_offsets: list[int] = []
+            # Callers decoding many documents can batch-decode them and pass the text in
+            self.text = text if text is not None else decode(token_ids)
+            return
+
+        token_bytes = [token_bytes_table[token_id] for token_id in token_ids]
+        self._bytes = b"".join(token_bytes)
+        self._byte_offsets = [0, *accumulate(map(len, token_bytes))]
+        self.text = self._decode_bytes(0, len(token_ids))
+
+    def get_text(self, start: int, stop: int) -> str:
+        """Returns the text of `token_ids[start:stop]`."""
+        start, stop, _ = slice(start, stop).indices(len(self.token_ids))
+        if self._bytes is None:
+            return self._decode(self.token_ids[start:stop])
+
+        return self._decode_bytes(start, max(start, stop))
+
+    def get_range(self, start: int, stop: int) -> "DecodedTokens":
+        """Returns `token_ids[start:stop]` as its own DecodedTokens without decoding it again."""
+        start, stop, _ = slice(start, stop).indices(len(self.token_ids))
+        stop = max(start, stop)
+
+        decoded_range = copy(self)
+        decoded_range.token_ids = self.token_ids[start:stop]
+        decoded_range.text = self.get_text(start, stop)
+        if self._bytes is not None:
+            byte_start = self._byte_offsets[start]
+            decoded_range._bytes = self._bytes[byte_start : self._byte_offsets[stop]]
+            decoded_range._byte_offsets = [
+                byte_offset - byte_start
+                for byte_offset in self._byte_offsets[start : stop + 1]
+            ]
+
+        return decoded_range
+
+    def _decode_bytes(self, start: int, stop: int) -> str:
+        assert self._bytes is not None
+
+        try:
+            text = self._bytes[
+                self._byte_offsets[start] : self._byte_offsets[stop]
+            ].decode()
+        except UnicodeDecodeError:
+            # The range cuts through a character or holds invalid bytes, the tokenizer has its own rules for replacing those
+            return self._decode(self.token_ids[start:stop])
+
+        return text[1:] if text.startswith(" ") else text
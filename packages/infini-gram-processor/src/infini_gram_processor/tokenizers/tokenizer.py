@@ -1,5 +1,5 @@
 from os import PathLike
-from typing import Iterable, List, Sequence, Tuple, cast
+from typing import Iterable, List, NamedTuple, Sequence, Tuple, cast
 
 from transformers import (  # type: ignore
     AutoTokenizer,
@@ -12,12 +12,22 @@ from transformers.tokenization_utils_base import (  # type: ignore
     TextInput,
 )
 
+from .decoded_tokens import DecodedTokens, get_token_bytes_table
+
+
+class EncodedText(NamedTuple):
+    token_ids: List[int]
+    # (start, end) character offsets into the encoded text for each token
+    offset_mapping: List[Tuple[int, int]]
+
 
 class Tokenizer:
     hf_tokenizer: PreTrainedTokenizer | PreTrainedTokenizerFast
     delimiter_mapping: dict[str, int]
     eos_token_id: int
     bow_ids_path: str
+    # Tokens that begin a word, the engine only starts and ends spans on these when spans have to be whole words
+    bow_ids: frozenset[int]
 
     def __init__(
         self,
@@ -40,6 +50,11 @@ class Tokenizer:
         self.eos_token_id = self.hf_tokenizer.eos_token_id
         self.delimiter_mapping = delimiter_mapping
         self.bow_ids_path = bow_ids_path
+        with open(bow_ids_path) as bow_ids_file:
+            self.bow_ids = frozenset(
+                int(line) for line in bow_ids_file if line.strip() != ""
+            )
+        self._token_bytes_table = get_token_bytes_table(self.hf_tokenizer)
 
     def tokenize(
         self, input: TextInput | PreTokenizedInput | EncodedInput
@@ -50,20 +65,78 @@ class Tokenizer:
     def decode_tokens(self, token_ids: Iterable[int]) -> str:
         return self.hf_tokenizer.decode(token_ids)  # type: ignore
 
-    def tokenize_to_list(self, input: TextInput) -> Sequence[str]:
-        tokenized_input = self.hf_tokenizer(input, return_offsets_mapping=True)
+    def decode_tokens_with_offsets(self, token_ids: Sequence[int]) -> DecodedTokens:
+        return DecodedTokens(
+            token_ids=token_ids,
+            token_bytes_table=self._token_bytes_table,
+            decode=self.decode_tokens,
+        )
 
-        offset_mapping = tokenized_input.data.get("offset_mapping", [])  # pyright: ignore [reportUnknownMemberType]
-        # This is to fix a corner case: when input begins with a number, the token ids will begin with [29871 (whitespace), 29896, ...] with offset_mapping being [(0, 1), (0, 1), ...]
-        if len(offset_mapping) > 1:
-            if offset_mapping[0][1] > offset_mapping[1][0]:
-                offset_mapping[0] = (offset_mapping[0][0], offset_mapping[1][0])
+    def batch_decode_tokens(
+        self, token_ids_batch: Sequence[Sequence[int]]
+    ) -> List[str]:
+        return [
+            decoded_tokens.text
+            for decoded_tokens in self.batch_decode_tokens_with_offsets(token_ids_batch)
+        ]
+
+    def batch_decode_tokens_with_offsets(
+        self, token_ids_batch: Sequence[Sequence[int]]
+    ) -> List[DecodedTokens]:
+        # Tokenizers we have a bytes table for decode without calling into HF at all, others are decoded in one batch call
+        texts: Sequence[str | None] = (
+            cast(List[str], self.hf_tokenizer.batch_decode(token_ids_batch))  # pyright: ignore[reportUnknownMemberType]
+            if self._token_bytes_table is None
+            else [None] * len(token_ids_batch)
+        )
 
         return [
-            input[offset[0] : offset[1]]
-            for offset in cast(List[Tuple[(int, int)]], offset_mapping)
+            DecodedTokens(
+                token_ids=token_ids,
+                token_bytes_table=self._token_bytes_table,
+                decode=self.decode_tokens,
+                text=text,
+            )
+            for token_ids, text in zip(token_ids_batch, texts)
         ]
 
+    def encode(self, input: TextInput) -> EncodedText:
+        """Tokenizes `input` once, returning the token ids along with each token's character offsets."""
+        return self.batch_encode([input])[0]
+
+    def batch_encode(self, inputs: Sequence[TextInput]) -> List[EncodedText]:
+        tokenized_inputs = self.hf_tokenizer(list(inputs), return_offsets_mapping=True)
+
+        token_ids_batch = cast(
+            List[List[int]],
+            tokenized_inputs.data.get("input_ids", []),  # pyright: ignore [reportUnknownMemberType]
+        )
+        offset_mapping_batch = cast(
+            List[List[Tuple[int, int]]],
+            tokenized_inputs.data.get("offset_mapping", []),  # pyright: ignore [reportUnknownMemberType]
+        )
+
+        encoded_inputs: List[EncodedText] = []
+        for token_ids, offset_mapping in zip(token_ids_batch, offset_mapping_batch):
+            # This is to fix a corner case: when input begins with a number, the token ids will begin with [29871 (whitespace), 29896, ...] with offset_mapping being [(0, 1), (0, 1), ...]
+            if len(offset_mapping) > 1:
+                if offset_mapping[0][1] > offset_mapping[1][0]:
+                    offset_mapping[0] = (offset_mapping[0][0], offset_mapping[1][0])
+
+            encoded_inputs.append(
+                EncodedText(token_ids=token_ids, offset_mapping=offset_mapping)
+            )
+
+        return encoded_inputs
+
+    def get_token_texts(
+        self, input: TextInput, encoded_input: EncodedText
+    ) -> Sequence[str]:
+        return [input[start:end] for start, end in encoded_input.offset_mapping]
+
+    def tokenize_to_list(self, input: TextInput) -> Sequence[str]:
+        return self.get_token_texts(input, self.encode(input))
+
     def tokenize_attribution_delimiters(self, delimiters: Iterable[str]) -> List[int]:
         """
         A method made specifically to tokenize delimiters for attribution uses.
@@ -0,0 +1,125 @@
+"""
+Reads and writes the unigram counts sidecar file we keep next to an index directory's shards.
+
+Computing unigram counts means scanning every token in every shard, which takes minutes on the big indexes. The sidecar lets a process memory-map counts that were computed once instead.
+
+Build sidecars for index directories with `python -m infini_gram_processor.build_unigram_counts <index_dir>...`
+"""
+
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+from glob import glob
+from hashlib import sha256
+from typing import Iterable, Sequence
+
+from .processor_config import get_processor_config
+
+UNIGRAM_COUNTS_FILE_VERSION = 1
+
+_MAGIC = b"IGUC"
+# magic, file version, vocab size, fingerprint of the shard files the counts came from
+_HEADER = struct.Struct("<4sIQ32s")
+
+
+def get_shard_paths(index_dir: str) -> list[str]:
+    """Returns the token files of every shard in an index directory."""
+    return sorted(glob(os.path.join(index_dir, "tokenized.*")))
+
+
+def sum_unigram_counts(counts_by_shard: Iterable[Sequence[int]]) -> Sequence[int]:
+    # The engine returns counts keyed by token id, so index them rather than iterating
+    total_counts: array[int] | None = None
+    for counts in counts_by_shard:
+        if total_counts is None:
+            total_counts = array("Q", bytes(8 * len(counts)))
+
+        for token_id in range(len(total_counts)):
+            total_counts[token_id] += counts[token_id]
+
+    return total_counts if total_counts is not None else array("Q")
+
+
+def _get_shard_fingerprint(index_dir: str) -> bytes:
+    fingerprint = sha256()
+    for shard_path in get_shard_paths(index_dir):
+        fingerprint.update(
+            f"{os.path.basename(shard_path)}:{os.path.getsize(shard_path)}\n".encode()
+        )
+
+    return fingerprint.digest()
+
+
+def get_unigram_counts_path(index_dir: str) -> str:
+    file_name = f"unigram_counts.v{UNIGRAM_COUNTS_FILE_VERSION}.bin"
+
+    unigram_counts_dir = get_processor_config().unigram_counts_dir
+    if unigram_counts_dir is None:
+        return os.path.join(index_dir, file_name)
+
+    # Index directories can share a basename, so qualify it with a hash of the full path
+    real_index_dir = os.path.realpath(index_dir)
+    index_dir_hash = sha256(real_index_dir.encode()).hexdigest()[:12]
+    return os.path.join(
+        unigram_counts_dir,
+        f"{os.path.basename(real_index_dir)}-{index_dir_hash}.{file_name}",
+    )
+
+
+def read_unigram_counts(index_dir: str) -> Sequence[int] | None:
+    """
+    Memory-maps the sidecar for `index_dir`.
+
+    Returns None if there's no sidecar or if it was written by another file version or for different shard files.
+    """
+    path = get_unigram_counts_path(index_dir)
+
+    try:
+        with open(path, "rb") as file:
+            mapped_file = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):
+        # mmap raises a ValueError for empty files
+        return None
+
+    if len(mapped_file) < _HEADER.size:
+        return None
+
+    magic, version, vocab_size, shard_fingerprint = _HEADER.unpack_from(mapped_file)
+    if (
+        magic != _MAGIC
+        or version != UNIGRAM_COUNTS_FILE_VERSION
+        or len(mapped_file) != _HEADER.size + vocab_size * 8
+        or shard_fingerprint != _get_shard_fingerprint(index_dir)
+    ):
+        return None
+
+    # The memoryview keeps the mapping open for as long as the counts are in use
+    return memoryview(mapped_file)[_HEADER.size :].cast("Q")
+
+
+def write_unigram_counts(index_dir: str, unigram_counts: Sequence[int]) -> str:
+    path = get_unigram_counts_path(index_dir)
+    header = _HEADER.pack(
+        _MAGIC,
+        UNIGRAM_COUNTS_FILE_VERSION,
+        len(unigram_counts),
+        _get_shard_fingerprint(index_dir),
+    )
+
+    # Write to a temporary file first so readers never see a partial sidecar
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(file_descriptor, "wb") as file:
+            file.write(header)
+            file.write(array("Q", unigram_counts).tobytes())
+
+        os.chmod(temporary_path, 0o644)
+
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+    return path